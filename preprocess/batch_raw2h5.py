@@ -1,117 +1,558 @@
 import os
-from metavision_core.event_io import EventsIterator
+import argparse
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from metavision_core.event_io import EventsIterator, RawReader
 import h5py
 import numpy as np
 from tqdm import tqdm
+from found_timestamp import save_trigger_timestamps
+from batch_utils import (find_raw_files, run_jobs, raw_signature, atomic_output,
+                         Manifest, MANIFEST_NAME)
+from event_store import TimeIndexBuilder, write_time_index, DEFAULT_INDEX_STEP
+from h5_codecs import (DEFAULT_CODECS, DIRECT_CHUNK_CODECS, codec_options, parse_codecs,
+                       ParallelChunkWriter)
 
-def convert_raw_to_h5(raw_path, h5_path, x_offset=340, y_offset=60):
-    """将单个raw文件转换为h5文件，并应用坐标偏移
+# 流式写入时每个分块包含的事件数
+DEFAULT_CHUNK_SIZE = 1 << 18
+
+# 拍摄脚本中事件相机数字裁剪窗口的尺寸（roi 340..939, 60..659）
+ROI_WIDTH = 600
+ROI_HEIGHT = 600
+
+# 超出ROI的事件在roi_mode='flag'时的坐标标记值
+ROI_FLAG = np.iinfo(np.uint16).max
+
+def remap_events(evs, x_offset, y_offset, out_x, out_y, out_p, out_t,
+                 width=ROI_WIDTH, height=ROI_HEIGHT, roi_mode='drop'):
+    """对一批事件做ROI偏移和有效性筛选，结果直接写入输出缓冲区的开头
+    
+    坐标以uint16减去偏移后，ROI左上方的事件会回绕成很大的值，
+    因此只需判断结果是否小于width/height即可同时排除两侧的越界事件。
     
     Args:
-        raw_path: raw文件路径
-        h5_path: 输出的h5文件路径
-        x_offset: x方向的偏移量
-        y_offset: y方向的偏移量
+        evs: 事件结构化数组
+        x_offset, y_offset: ROI左上角坐标
+        out_x, out_y, out_p, out_t: 输出缓冲区，长度不小于len(evs)
+        width, height: ROI尺寸
+        roi_mode: 'drop'丢弃越界事件；'flag'保留越界事件，并将其x, y置为ROI_FLAG
+    
+    Returns:
+        (写入的事件数, 越界的事件数)
     """
-    print(f"处理文件: {raw_path}")
+    n = len(evs)
+    x, y = out_x[:n], out_y[:n]
+    np.subtract(evs['x'], x_offset, out=x, casting='unsafe')
+    np.subtract(evs['y'], y_offset, out=y, casting='unsafe')
+    valid = x < width
+    valid &= y < height
+    num_valid = int(np.count_nonzero(valid))
     
-    # 预先计算大致的事件数量
-    estimated_events = int(60 * 1e6)  # 60秒 * 每秒100万个事件
+    if num_valid == n or roi_mode == 'flag':
+        np.copyto(out_p[:n], evs['p'], casting='unsafe')
+        np.copyto(out_t[:n], evs['t'], casting='unsafe')
+        if num_valid < n:
+            invalid = ~valid
+            x[invalid] = ROI_FLAG
+            y[invalid] = ROI_FLAG
+        return n, n - num_valid
     
-    # 预分配numpy数组，使用正确的数据类型
-    x_array = np.zeros(estimated_events, dtype=np.uint16)
-    y_array = np.zeros(estimated_events, dtype=np.uint16)
-    p_array = np.zeros(estimated_events, dtype=np.uint8)
-    t_array = np.zeros(estimated_events, dtype=np.int64)
+    # 存在越界事件时才做压缩，正常情况下不产生额外的临时数组
+    out_x[:num_valid] = x[valid]
+    out_y[:num_valid] = y[valid]
+    np.copyto(out_p[:num_valid], evs['p'][valid], casting='unsafe')
+    out_t[:num_valid] = evs['t'][valid]
+    return num_valid, n - num_valid
+
+class _BatchBuffers:
+    """流式写入器复用的单批输出缓冲区，按需扩容"""
     
-    current_idx = 0
+    def __init__(self):
+        self.size = 0
     
-    mv_iterator = EventsIterator(input_path=raw_path, delta_t=1000000, start_ts=0,
-                               max_duration=1e6 * 60)
-    total_steps = int((1e6 * 60) // 1000000)
+    def get(self, n):
+        if n > self.size:
+            self.size = n
+            self.x = np.empty(n, dtype=np.uint16)
+            self.y = np.empty(n, dtype=np.uint16)
+            self.p = np.empty(n, dtype=np.uint8)
+            self.t = np.empty(n, dtype=np.int64)
+        return self.x, self.y, self.p, self.t
 
-    for evs in tqdm(mv_iterator, total=total_steps, desc="读取事件"):
-        batch_events = len(evs)
-        
-        if current_idx + batch_events > len(x_array):
-            new_size = len(x_array) + estimated_events
-            x_array.resize(new_size, refcheck=False)
-            y_array.resize(new_size, refcheck=False)
-            p_array.resize(new_size, refcheck=False)
-            t_array.resize(new_size, refcheck=False)
+class BufferedEventWriter:
+    """在内存中预分配数组累积事件，关闭时一次性写入h5文件"""
+    
+    def __init__(self, h5_path, estimated_events=int(60 * 1e6), index_step=DEFAULT_INDEX_STEP,
+                 roi_mode='drop', codecs=None):
+        self.h5_path = h5_path
+        self.roi_mode = roi_mode
+        self.codecs = dict(DEFAULT_CODECS, **(codecs or {}))
+        # 预先计算大致的事件数量：60秒 * 每秒100万个事件
+        self.estimated_events = estimated_events
         
-        # 应用坐标偏移，并确保结果为非负数
-        x_coords = evs['x'] - x_offset
-        y_coords = evs['y'] - y_offset
+        # 预分配numpy数组，使用正确的数据类型
+        self.x_array = np.zeros(estimated_events, dtype=np.uint16)
+        self.y_array = np.zeros(estimated_events, dtype=np.uint16)
+        self.p_array = np.zeros(estimated_events, dtype=np.uint8)
+        self.t_array = np.zeros(estimated_events, dtype=np.int64)
+        self.triggers = None
+        self.time_index = TimeIndexBuilder(index_step)
+        self.count = 0
+        self.dropped = 0
+        self.t_min = None
+        self.t_max = None
+    
+    def append(self, evs, x_offset=0, y_offset=0):
+        """追加一批事件，应用坐标偏移并筛选ROI"""
+        batch_events = len(evs)
+        if batch_events == 0:
+            return
+        current_idx = self.count
         
+        if current_idx + batch_events > len(self.x_array):
+            new_size = len(self.x_array) + max(self.estimated_events, batch_events)
+            self.x_array.resize(new_size, refcheck=False)
+            self.y_array.resize(new_size, refcheck=False)
+            self.p_array.resize(new_size, refcheck=False)
+            self.t_array.resize(new_size, refcheck=False)
         
-        # 转换数据类型并保存
-        x_array[current_idx:current_idx+batch_events] = x_coords.astype(np.uint16)
-        y_array[current_idx:current_idx+batch_events] = y_coords.astype(np.uint16)
-        p_array[current_idx:current_idx+batch_events] = evs['p'].astype(np.uint8)
-        t_array[current_idx:current_idx+batch_events] = evs['t']
+        # 应用坐标偏移并直接写入预分配数组
+        written, dropped = remap_events(
+            evs, x_offset, y_offset, self.x_array[current_idx:], self.y_array[current_idx:],
+            self.p_array[current_idx:], self.t_array[current_idx:], roi_mode=self.roi_mode)
+        self.dropped += dropped
+        if written == 0:
+            return
         
-        current_idx += batch_events
+        t = self.t_array[current_idx:current_idx+written]
+        self.time_index.update(t, current_idx)
+        self.count += written
+        _update_time_range(self, t)
+    
+    def write_triggers(self, triggers):
+        """记录触发信号，关闭时写入h5文件的triggers组"""
+        self.triggers = triggers
+    
+    def close(self):
+        # 裁剪到实际大小并保存到HDF5文件
+        with h5py.File(self.h5_path, 'w') as f:
+            for name, array in (('x', self.x_array), ('y', self.y_array), ('p', self.p_array), ('t', self.t_array)):
+                f.create_dataset(name, data=array[:self.count], **codec_options(self.codecs[name]))
+            write_time_index(f, self.time_index)
+            f.attrs['roi_dropped'] = self.dropped
+            if self.triggers is not None:
+                _write_trigger_group(f, self.triggers)
+        self.x_array = self.y_array = self.p_array = self.t_array = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+class H5EventWriter:
+    """将每批事件直接追加到可扩展的分块h5数据集中
+    
+    峰值内存只与单批事件的大小有关，与录制时长无关。
+    compress_workers大于1时，使用none/gzip/shuffle-gzip编码的列由线程池并行压缩分块，
+    其他编码仍由HDF5的过滤器流水线压缩。
+    """
+    
+    def __init__(self, h5_path, chunk_size=DEFAULT_CHUNK_SIZE, index_step=DEFAULT_INDEX_STEP,
+                 roi_mode='drop', codecs=None, compress_workers=1):
+        self.h5_path = h5_path
+        self.roi_mode = roi_mode
+        self.buffers = _BatchBuffers()
+        self.codecs = dict(DEFAULT_CODECS, **(codecs or {}))
+        self.f = h5py.File(h5_path, 'w')
+        self.datasets = {}
+        for name, dtype in (('x', np.uint16), ('y', np.uint16), ('p', np.uint8), ('t', np.int64)):
+            self.datasets[name] = self.f.create_dataset(
+                name, shape=(0,), maxshape=(None,), dtype=dtype, chunks=(chunk_size,),
+                **codec_options(self.codecs[name]))
+        self.executor = None
+        self.chunk_writers = {}
+        if compress_workers > 1:
+            self.executor = ThreadPoolExecutor(max_workers=compress_workers)
+            for name, dset in self.datasets.items():
+                if self.codecs[name] in DIRECT_CHUNK_CODECS:
+                    self.chunk_writers[name] = ParallelChunkWriter(
+                        dset, self.codecs[name], self.executor, max_pending=2 * compress_workers)
+        self.time_index = TimeIndexBuilder(index_step)
+        self.count = 0
+        self.dropped = 0
+        self.t_min = None
+        self.t_max = None
+    
+    def append(self, evs, x_offset=0, y_offset=0):
+        """追加一批事件，应用坐标偏移并筛选ROI"""
+        if len(evs) == 0:
+            return
+        out = self.buffers.get(len(evs))
+        written, dropped = remap_events(evs, x_offset, y_offset, *out, roi_mode=self.roi_mode)
+        self.dropped += dropped
+        if written == 0:
+            return
+        start, end = self.count, self.count + written
+        for (name, dset), column in zip(self.datasets.items(), out):
+            if name in self.chunk_writers:
+                self.chunk_writers[name].append(column[:written])
+            else:
+                dset.resize((end,))
+                dset[start:end] = column[:written]
+        t = out[3][:written]
+        self.time_index.update(t, start)
+        self.count = end
+        _update_time_range(self, t)
+    
+    def write_triggers(self, triggers):
+        """将触发信号写入h5文件的triggers组"""
+        _write_trigger_group(self.f, triggers)
+    
+    def close(self):
+        for chunk_writer in self.chunk_writers.values():
+            chunk_writer.close()
+        if self.executor is not None:
+            self.executor.shutdown()
+        write_time_index(self.f, self.time_index)
+        self.f.attrs['roi_dropped'] = self.dropped
+        self.f.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+class NpyEventWriter:
+    """将事件按列直接追加写入目录下的x.npy, y.npy, p.npy, t.npy
+    
+    文件不压缩，读取时可用np.load(mmap_mode='r')内存映射并零拷贝地切片。
+    每个文件预留固定长度的.npy文件头，关闭时再写入实际的事件数。
+    """
+    
+    HEADER_SIZE = 128
+    COLUMNS = (('x', np.uint16), ('y', np.uint16), ('p', np.uint8), ('t', np.int64))
+    
+    def __init__(self, out_dir, roi_mode='drop'):
+        self.out_dir = out_dir
+        self.roi_mode = roi_mode
+        self.buffers = _BatchBuffers()
+        os.makedirs(out_dir, exist_ok=True)
+        self.files = {}
+        for name, dtype in self.COLUMNS:
+            f = open(os.path.join(out_dir, name + '.npy'), 'wb')
+            f.seek(self.HEADER_SIZE)
+            self.files[name] = f
+        self.count = 0
+        self.dropped = 0
+        self.t_min = None
+        self.t_max = None
+    
+    def append(self, evs, x_offset=0, y_offset=0):
+        """追加一批事件，应用坐标偏移并筛选ROI"""
+        if len(evs) == 0:
+            return
+        out = self.buffers.get(len(evs))
+        written, dropped = remap_events(evs, x_offset, y_offset, *out, roi_mode=self.roi_mode)
+        self.dropped += dropped
+        if written == 0:
+            return
+        for f, column in zip(self.files.values(), out):
+            f.write(column[:written].data)
+        self.count += written
+        _update_time_range(self, out[3][:written])
+    
+    def write_triggers(self, triggers):
+        """将触发信号保存为triggers_p.npy, triggers_t.npy, triggers_id.npy"""
+        np.save(os.path.join(self.out_dir, 'triggers_p.npy'), np.asarray(triggers['p'], dtype=np.int16))
+        np.save(os.path.join(self.out_dir, 'triggers_t.npy'), np.asarray(triggers['t'], dtype=np.int64))
+        np.save(os.path.join(self.out_dir, 'triggers_id.npy'), np.asarray(triggers['id'], dtype=np.int16))
+    
+    def close(self):
+        for name, dtype in self.COLUMNS:
+            f = self.files[name]
+            f.seek(0)
+            f.write(_npy_header(dtype, self.count, self.HEADER_SIZE))
+            f.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def _npy_header(dtype, length, header_size):
+    # .npy 1.0格式：魔数、版本、头长度，随后是以换行结尾并用空格补齐的字典
+    header = "{'descr': %r, 'fortran_order': False, 'shape': (%d,), }" % (
+        np.lib.format.dtype_to_descr(np.dtype(dtype)), length)
+    header_len = header_size - 10
+    header = header.ljust(header_len - 1) + '\n'
+    return b'\x93NUMPY\x01\x00' + struct.pack('<H', header_len) + header.encode('latin1')
+
+def _update_time_range(writer, t):
+    # 事件按时间有序，首尾即为本批的最小和最大时间戳
+    if writer.t_min is None:
+        writer.t_min = int(t[0])
+    writer.t_max = int(t[-1])
 
-    # 裁剪到实际大小
-    x_array = x_array[:current_idx]
-    y_array = y_array[:current_idx]
-    p_array = p_array[:current_idx]
-    t_array = t_array[:current_idx]
+def _write_trigger_group(f, triggers):
+    g = f.create_group('triggers')
+    g.create_dataset('p', data=np.asarray(triggers['p'], dtype=np.int16))
+    g.create_dataset('t', data=np.asarray(triggers['t'], dtype=np.int64))
+    g.create_dataset('id', data=np.asarray(triggers['id'], dtype=np.int16))
 
-    # 保存到HDF5文件
-    with h5py.File(h5_path, 'w') as f:
-        f.create_dataset('x', data=x_array, compression='gzip', compression_opts=1)
-        f.create_dataset('y', data=y_array, compression='gzip', compression_opts=1)
-        f.create_dataset('p', data=p_array, compression='gzip', compression_opts=1)
-        f.create_dataset('t', data=t_array, compression='gzip', compression_opts=1)
+def open_event_writer(h5_path, streaming=False, chunk_size=DEFAULT_CHUNK_SIZE, out_format='h5',
+                      roi_mode='drop', codecs=None, compress_workers=1):
+    """根据写入模式创建事件写入器
+    
+    Args:
+        h5_path: 输出路径，out_format为'npy'时为目录
+        streaming: 为True时逐批追加到分块数据集，否则在内存中累积后一次写入
+        chunk_size: 流式写入时每个分块的事件数
+        out_format: 'h5'为gzip压缩的h5文件，'npy'为可内存映射的按列.npy目录（总是流式写入）
+        roi_mode: 超出ROI事件的处理方式，'drop'丢弃，'flag'将坐标置为ROI_FLAG
+        codecs: 各列的h5压缩编码，如{'t': 'scaleoffset-gzip'}，见h5_codecs.codec_options
+        compress_workers: 流式写入h5时并行压缩分块的线程数，非流式写入时无效
+    """
+    if out_format == 'npy':
+        return NpyEventWriter(h5_path, roi_mode=roi_mode)
+    if streaming:
+        return H5EventWriter(h5_path, chunk_size, roi_mode=roi_mode, codecs=codecs,
+                             compress_workers=compress_workers)
+    if compress_workers > 1:
+        print(f"警告: 非流式写入时compress_workers={compress_workers}无效，需要streaming=True")
+    return BufferedEventWriter(h5_path, roi_mode=roi_mode, codecs=codecs)
+
+def convert_raw_to_h5(raw_path, h5_path, x_offset=340, y_offset=60,
+                      streaming=False, chunk_size=DEFAULT_CHUNK_SIZE, progress=True, out_format='h5',
+                      roi_mode='drop', codecs=None, compress_workers=1, max_duration=None):
+    """将单个raw文件转换为h5文件，并应用坐标偏移
+    
+    Args:
+        raw_path: raw文件路径
+        h5_path: 输出的h5文件路径
+        x_offset: x方向的偏移量
+        y_offset: y方向的偏移量
+        streaming: 是否逐批流式写入h5文件
+        chunk_size: 流式写入时每个分块的事件数
+        progress: 是否显示单个文件的读取进度条
+        out_format: 输出格式，'h5'或'npy'（此时h5_path为输出目录）
+        roi_mode: 超出ROI事件的处理方式，'drop'丢弃，'flag'将坐标置为ROI_FLAG
+        codecs: 各列的h5压缩编码
+        compress_workers: 流式写入h5时并行压缩分块的线程数
+        max_duration: 最多读取的时长（微秒），为None时读取整个文件
+    
+    Returns:
+        {'event_count': 事件总数, 't_min': 首个事件时间, 't_max': 末个事件时间,
+         'roi_dropped': ROI外的事件数}
+    """
+    print(f"处理文件: {raw_path}")
+    
+    mv_iterator = EventsIterator(input_path=raw_path, delta_t=1000000, start_ts=0,
+                               max_duration=max_duration)
+    # 不限时长时事先不知道总秒数，进度条只计数
+    total_steps = int(max_duration // 1000000) if max_duration is not None else None
+
+    # 先写入临时文件，完成后再重命名，避免中断时留下不完整的h5
+    with atomic_output(h5_path) as tmp_h5_path:
+        with open_event_writer(tmp_h5_path, streaming, chunk_size, out_format, roi_mode,
+                               codecs, compress_workers) as writer:
+            for evs in tqdm(mv_iterator, total=total_steps, desc="读取事件", disable=not progress):
+                writer.append(evs, x_offset, y_offset)
+    
+    print(f"已保存到: {h5_path}")
+    print(f"事件总数: {writer.count}")
+    if writer.dropped:
+        print(f"ROI外事件数: {writer.dropped}")
+    return {'event_count': writer.count, 't_min': writer.t_min, 't_max': writer.t_max,
+            'roi_dropped': writer.dropped}
+
+def convert_raw_to_h5_with_triggers(raw_path, h5_path, txt_path, x_offset=340, y_offset=60,
+                                    polarity=0, do_time_shifting=True, max_duration=None,
+                                    streaming=False, chunk_size=DEFAULT_CHUNK_SIZE, progress=True,
+                                    out_format='h5', roi_mode='drop', codecs=None, compress_workers=1):
+    """只解码一遍raw文件，同时输出h5事件文件和触发时间戳文件
+    
+    事件和触发信号来自同一个RawReader，因此二者使用同一时间基准。
+    触发信号（未按极性筛选）同时写入h5文件的triggers组。
+    
+    Args:
+        raw_path: raw文件路径
+        h5_path: 输出的h5文件路径
+        txt_path: 输出的时间戳txt文件路径
+        x_offset: x方向的偏移量
+        y_offset: y方向的偏移量
+        polarity: 写入txt的触发极性，0为正，1为负
+        do_time_shifting: 是否进行时间偏移
+        max_duration: 最多读取的时长（微秒），为None时读取整个文件
+        streaming: 是否逐批流式写入h5文件
+        chunk_size: 流式写入时每个分块的事件数
+        progress: 是否显示单个文件的读取进度条
+        out_format: 输出格式，'h5'或'npy'（此时h5_path为输出目录）
+        roi_mode: 超出ROI事件的处理方式，'drop'丢弃，'flag'将坐标置为ROI_FLAG
+        codecs: 各列的h5压缩编码
+        compress_workers: 流式写入h5时并行压缩分块的线程数
+    
+    Returns:
+        {'event_count': 事件总数, 't_min': 首个事件时间, 't_max': 末个事件时间,
+         'roi_dropped': ROI外的事件数, 'trigger_count': 触发信号总数}
+    """
+    print(f"处理文件: {raw_path}")
+    
+    with atomic_output(h5_path) as tmp_h5_path:
+        with open_event_writer(tmp_h5_path, streaming, chunk_size, out_format, roi_mode,
+                               codecs, compress_workers) as writer:
+            with RawReader(str(raw_path), do_time_shifting=do_time_shifting) as ev_data:
+                total_steps = int(max_duration // 1000000) if max_duration is not None else None
+                with tqdm(total=total_steps, desc="读取事件", disable=not progress) as pbar:
+                    while not ev_data.is_done() and (max_duration is None or ev_data.current_time < max_duration):
+                        writer.append(ev_data.load_delta_t(1000000), x_offset, y_offset)
+                        pbar.update(1)
+                # 触发信号在解码过程中已被累积，无需再读一遍文件
+                triggers = ev_data.get_ext_trigger_events()
+            writer.write_triggers(triggers)
     
     print(f"已保存到: {h5_path}")
-    print(f"事件总数: {current_idx}")
+    print(f"事件总数: {writer.count}")
+    if writer.dropped:
+        print(f"ROI外事件数: {writer.dropped}")
+    
+    with atomic_output(txt_path) as tmp_txt_path:
+        save_trigger_timestamps(triggers, tmp_txt_path, polarity)
+    print(f"已保存时间戳到: {txt_path}")
+    return {'event_count': writer.count, 't_min': writer.t_min, 't_max': writer.t_max,
+            'roi_dropped': writer.dropped, 'trigger_count': len(triggers)}
 
-def batch_convert(base_input_dir, base_output_dir, x_offset=340, y_offset=60):
+def batch_convert(base_input_dir, base_output_dir, x_offset=340, y_offset=60,
+                  with_timestamps=False, polarity=0, streaming=False, chunk_size=DEFAULT_CHUNK_SIZE,
+                  workers=1, force=False, out_format='h5', roi_mode='drop', codecs=None,
+                  compress_workers=1, max_duration=None, do_time_shifting=True):
     """批量转换文件夹下的所有raw文件
     
+    输出目录下的manifest.json记录每个输出对应的raw签名和转换结果，
+    重新运行时跳过raw未变化且输出完整的文件，因此中断后可以继续。
+    
+    with_timestamps为True时{i}.h5和{i}.txt来自同一个RawReader，使用同一时间基准
+    （由do_time_shifting决定）；默认进行时间偏移，与只转换h5时EventsIterator的时间一致，
+    但与found_timestamp.batch_process_timestamps（do_time_shifting=False）输出的{i}.txt不同，
+    两者不能混用。
+    
     Args:
         base_input_dir: 输入目录路径
         base_output_dir: 输出目录路径
         x_offset: x方向的偏移量
         y_offset: y方向的偏移量
+        with_timestamps: 为True时每个raw只解码一次，同时输出{i}.h5和{i}.txt时间戳
+        do_time_shifting: with_timestamps为True时是否进行时间偏移（h5和txt相同）
+        polarity: 写入时间戳文件的触发极性
+        streaming: 是否逐批流式写入h5文件，内存占用与录制时长无关
+        chunk_size: 流式写入时每个分块的事件数
+        workers: 并行转换的进程数，1为逐个转换
+        force: 为True时忽略清单，重新转换所有文件
+        out_format: 'h5'输出{i}.h5；'npy'输出可内存映射的{i}.events目录
+        roi_mode: 超出ROI事件的处理方式，'drop'丢弃，'flag'将坐标置为ROI_FLAG
+        codecs: 各列的h5压缩编码，如{'t': 'scaleoffset-gzip'}
+        compress_workers: 每个文件流式写入时并行压缩分块的线程数
+        max_duration: 每个文件最多读取的时长（微秒），为None时读取整个录制
+    
+    Returns:
+        转换失败的文件列表 [(名称, 错误信息), ...]
     """
     os.makedirs(base_output_dir, exist_ok=True)
+    manifest = Manifest(os.path.join(base_output_dir, MANIFEST_NAME))
+    # 影响输出内容的参数，变化后需要重新转换
+    params = {'x_offset': x_offset, 'y_offset': y_offset, 'with_timestamps': with_timestamps,
+              'polarity': polarity if with_timestamps else None,
+              'do_time_shifting': do_time_shifting if with_timestamps else None, 'out_format': out_format,
+              'roi_mode': roi_mode, 'codecs': dict(DEFAULT_CODECS, **(codecs or {})),
+              'max_duration': max_duration}
+    out_ext = '.events' if out_format == 'npy' else '.h5'
     
-    # 处理1.10和1.11两个文件夹
-    for folder in ['1.10', '1.11']:
+    jobs = []
+    pending = {}
+    skipped = 0
+    for folder, i, raw_file in find_raw_files(base_input_dir):
         output_folder = os.path.join(base_output_dir, folder)
         os.makedirs(output_folder, exist_ok=True)
         
-        input_base = os.path.join(base_input_dir, folder)
-        # 遍历子文件夹（1,2,3...）
-        subfolders = [f for f in os.listdir(input_base) if os.path.isdir(os.path.join(input_base, f))]
-        subfolders.sort(key=int)  # 确保按数字顺序排序
+        name = f"{folder}/{i}"
+        h5_path = os.path.join(output_folder, f"{i}{out_ext}")
+        kwargs = dict(raw_path=raw_file, h5_path=h5_path,
+                      x_offset=x_offset, y_offset=y_offset, streaming=streaming,
+                      chunk_size=chunk_size, progress=workers <= 1, out_format=out_format,
+                      roi_mode=roi_mode, codecs=codecs, compress_workers=compress_workers,
+                      max_duration=max_duration)
+        outputs = [h5_path]
+        if with_timestamps:
+            txt_path = os.path.join(output_folder, f"{i}.txt")
+            kwargs.update(txt_path=txt_path, polarity=polarity, do_time_shifting=do_time_shifting)
+            outputs.append(txt_path)
         
-        for i, subfolder in enumerate(subfolders, 1):
-            event_folder = os.path.join(input_base, subfolder, 'event')
-            if not os.path.exists(event_folder):
-                print(f"跳过 {event_folder} - 文件夹不存在")
-                continue
-                
-            # 查找event.raw文件
-            raw_file = os.path.join(event_folder, 'event.raw')
-            if not os.path.exists(raw_file):
-                print(f"跳过 {raw_file} - 文件不存在")
-                continue
-            
-            h5_path = os.path.join(output_folder, f"{i}.h5")
-            convert_raw_to_h5(raw_file, h5_path, x_offset, y_offset)
+        signature = raw_signature(raw_file)
+        if not force and manifest.is_up_to_date(name, signature, params, outputs):
+            skipped += 1
+            continue
+        pending[name] = {'raw': raw_file, 'signature': signature, 'params': params,
+                         'outputs': outputs}
+        jobs.append((name, kwargs))
+    
+    if skipped:
+        print(f"跳过 {skipped} 个已是最新的文件")
+    
+    def record(name, result):
+        manifest.update(name, dict(pending[name], **result))
+    
+    func = convert_raw_to_h5_with_triggers if with_timestamps else convert_raw_to_h5
+    return run_jobs(func, jobs, workers, desc="转换raw文件", on_result=record)
+
+def parse_args():
+    """Defines and parses input arguments"""
+    parser = argparse.ArgumentParser(description="批量将raw文件转换为h5文件")
+    parser.add_argument('-i', '--input-dir', default="",
+                        help='raw文件所在的基础路径（包含1.10和1.11文件夹）')
+    parser.add_argument('-o', '--output-dir', default="./h5data",
+                        help='保存h5文件的基础路径')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='并行转换的进程数，每个raw文件由一个进程处理')
+    parser.add_argument('-f', '--force', action='store_true',
+                        help='忽略manifest.json，重新转换所有文件')
+    parser.add_argument('--format', dest='out_format', choices=['h5', 'npy'], default='h5',
+                        help='输出格式：h5为压缩的h5文件，npy为可内存映射的按列.npy目录')
+    parser.add_argument('--codec', action='append', metavar='COLUMN=CODEC',
+                        help='指定某列的压缩编码，可重复使用，如 --codec t=scaleoffset-gzip；'
+                             '可选none, gzip, lzf, shuffle-gzip, scaleoffset-gzip, blosc-lz4, blosc-zstd')
+    parser.add_argument('--streaming', action='store_true',
+                        help='逐批写入分块h5数据集，内存占用与录制时长无关，适合长时间或高事件率的录制')
+    parser.add_argument('--compress-workers', type=int, default=1,
+                        help='流式写入时并行压缩分块的线程数，大于1时自动使用--streaming')
+    parser.add_argument('--max-duration', type=float, default=None,
+                        help='每个文件最多转换的时长（秒），默认转换整个录制')
+    return parser.parse_args()
 
 if __name__ == '__main__':
+    args = parse_args()
+    
     # 设置输入和输出的基础路径
-    base_input_dir = ""  # 请修改为你的raw文件所在的基础路径
-    base_output_dir = "./h5data"   # 请修改为你想要保存h5文件的基础路径
+    base_input_dir = args.input_dir  # raw文件所在的基础路径
+    base_output_dir = args.output_dir   # 保存h5文件的基础路径
     
     # 设置坐标偏移量
     x_offset = 340  # x方向的偏移
     y_offset = 60   # y方向的偏移
     
-    batch_convert(base_input_dir, base_output_dir, x_offset, y_offset) 
\ No newline at end of file
+    # 为True时同时输出触发时间戳，无需再运行found_timestamp.py；
+    # 注意{i}.txt与h5使用同一时间基准（默认进行时间偏移），与found_timestamp.py输出的时间不同
+    with_timestamps = False
+    do_time_shifting = True
+    
+    # 为True时逐批写入分块h5数据集，适合长时间或高事件率的录制；并行压缩只在流式写入时可用
+    streaming = args.streaming or args.compress_workers > 1
+    chunk_size = DEFAULT_CHUNK_SIZE
+    
+    batch_convert(base_input_dir, base_output_dir, x_offset, y_offset, with_timestamps,
+                  streaming=streaming, chunk_size=chunk_size, workers=args.workers, force=args.force,
+                  out_format=args.out_format, codecs=parse_codecs(args.codec),
+                  compress_workers=args.compress_workers,
+                  max_duration=args.max_duration * 1e6 if args.max_duration is not None else None,
+                  do_time_shifting=do_time_shifting)
\ No newline at end of file
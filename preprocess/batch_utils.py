@@ -0,0 +1,178 @@
+import os
+import json
+import shutil
+import hashlib
+import traceback
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from tqdm import tqdm
+
+# 每次采集的session文件夹
+SESSION_FOLDERS = ['1.10', '1.11']
+
+# 批处理清单文件名，保存在输出目录下
+MANIFEST_NAME = 'manifest.json'
+
+def find_raw_files(base_input_dir, folders=SESSION_FOLDERS):
+    """遍历各session文件夹，查找每个子文件夹中的event.raw文件
+
+    Args:
+        base_input_dir: 包含1.10和1.11文件夹的根目录
+        folders: 需要处理的session文件夹
+
+    Returns:
+        [(folder, i, raw_file), ...]，i为子文件夹按数字排序后的编号（从1开始）
+    """
+    raw_files = []
+    for folder in folders:
+        input_base = os.path.join(base_input_dir, folder)
+        if not os.path.exists(input_base):
+            print(f"跳过 {input_base} - 文件夹不存在")
+            continue
+
+        # 遍历子文件夹（1,2,3...）
+        subfolders = [f for f in os.listdir(input_base) if os.path.isdir(os.path.join(input_base, f))]
+        subfolders.sort(key=int)  # 确保按数字顺序排序
+
+        for i, subfolder in enumerate(subfolders, 1):
+            event_folder = os.path.join(input_base, subfolder, 'event')
+            if not os.path.exists(event_folder):
+                print(f"跳过 {event_folder} - 文件夹不存在")
+                continue
+
+            # 查找event.raw文件
+            raw_file = os.path.join(event_folder, 'event.raw')
+            if not os.path.exists(raw_file):
+                print(f"跳过 {raw_file} - 文件不存在")
+                continue
+
+            raw_files.append((folder, i, raw_file))
+    return raw_files
+
+def raw_signature(raw_path, sample_size=1 << 20):
+    """计算raw文件的签名，用于判断输出是否需要重新生成
+
+    完整哈希几十GB的raw文件代价太高，因此只对文件头尾各sample_size字节取sha1，
+    并与文件大小、修改时间一起比较。
+
+    Returns:
+        {'size': 字节数, 'mtime': 修改时间, 'hash': 头尾采样的sha1}
+    """
+    stat = os.stat(raw_path)
+    h = hashlib.sha1()
+    with open(raw_path, 'rb') as f:
+        h.update(f.read(sample_size))
+        if stat.st_size > sample_size:
+            f.seek(max(sample_size, stat.st_size - sample_size))
+            h.update(f.read(sample_size))
+    return {'size': stat.st_size, 'mtime': stat.st_mtime, 'hash': h.hexdigest()}
+
+@contextmanager
+def atomic_output(path):
+    """先写入临时文件，成功后原子地重命名为目标文件
+
+    中途中断时目标文件不会出现半写入的状态，只会残留临时文件。
+    临时文件保留原扩展名（如1.h5 -> 1.tmp.h5），以便按扩展名选择写入格式。
+    """
+    root, ext = os.path.splitext(path)
+    tmp_path = root + '.tmp' + ext
+    try:
+        yield tmp_path
+    except BaseException:
+        _remove_path(tmp_path)
+        raise
+    # 输出为目录时os.replace不能覆盖非空目录，先删除旧的输出
+    if os.path.isdir(tmp_path) and os.path.isdir(path):
+        shutil.rmtree(path)
+    os.replace(tmp_path, path)
+
+def _remove_path(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+class Manifest:
+    """记录每个输出文件对应的raw签名、参数和转换结果
+
+    清单以json保存，每完成一个文件就原子地写回磁盘，
+    因此中断后重新运行时可以跳过已完成的文件。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                self.entries = json.load(f)
+
+    def is_up_to_date(self, key, signature, params, outputs):
+        """判断key对应的输出是否已是最新"""
+        entry = self.entries.get(key)
+        if entry is None:
+            return False
+        if entry.get('signature') != signature or entry.get('params') != params:
+            return False
+        return all(os.path.exists(p) for p in outputs)
+
+    def update(self, key, record):
+        self.entries[key] = record
+        self.save()
+
+    def save(self):
+        with atomic_output(self.path) as tmp_path:
+            with open(tmp_path, 'w') as f:
+                json.dump(self.entries, f, indent=2, ensure_ascii=False)
+
+def _run_job(func, kwargs):
+    try:
+        return func(**kwargs), None
+    except Exception:
+        return None, traceback.format_exc()
+
+def run_jobs(func, jobs, workers=1, desc="处理", on_result=None):
+    """执行一组相互独立的任务，单个任务失败不影响其他任务
+
+    Args:
+        func: 任务函数，需为模块级函数以便在子进程中调用
+        jobs: [(name, kwargs), ...]
+        workers: 进程数，小于等于1时在当前进程中依次执行
+        desc: 进度条描述
+        on_result: 每个任务成功后在主进程中调用 on_result(name, 返回值)
+
+    Returns:
+        失败任务列表 [(name, 错误信息), ...]
+    """
+    failures = []
+
+    def finish(name, result, error):
+        if error is not None:
+            failures.append((name, error))
+        elif on_result is not None:
+            on_result(name, result)
+        pbar.update(1)
+        pbar.set_postfix(failed=len(failures))
+
+    with tqdm(total=len(jobs), desc=desc) as pbar:
+        if workers <= 1:
+            for name, kwargs in jobs:
+                finish(name, *_run_job(func, kwargs))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = {executor.submit(_run_job, func, kwargs): name for name, kwargs in jobs}
+                for future in as_completed(futures):
+                    try:
+                        result, error = future.result()
+                    except Exception:
+                        # 子进程异常退出等情况
+                        result, error = None, traceback.format_exc()
+                    finish(futures[future], result, error)
+
+    if failures:
+        print(f"{len(failures)}/{len(jobs)} 个任务失败:")
+        for name, error in failures:
+            print(f"--- {name} ---")
+            print(error)
+    else:
+        print(f"全部 {len(jobs)} 个任务完成")
+    return failures
@@ -0,0 +1,312 @@
+import os
+import sys
+import json
+import time
+import types
+import argparse
+import tempfile
+import traceback
+import multiprocessing
+from queue import Empty
+import numpy as np
+
+# refocus.py在拍摄脚本目录下，Event.py本身依赖相机SDK和GUI，只测试其中的累积部分
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '拍摄脚本'))
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# 与metavision_core.event_io解码出的结构化数组一致
+EVENT_DTYPE = np.dtype([('x', '<u2'), ('y', '<u2'), ('p', '<i2'), ('t', '<i8')])
+TRIGGER_DTYPE = np.dtype([('p', '<i2'), ('t', '<i8'), ('id', '<i2')])
+
+# Event.py中数字裁剪窗口的默认位置 (x0, y0, width, height)
+DEFAULT_ROI = (340, 60, 600, 600)
+
+def synthetic_events(rate=5e6, duration=10.0, roi=DEFAULT_ROI, outside_ratio=0.0, seed=0):
+    """生成与RawReader输出格式一致的合成事件流
+
+    Args:
+        rate: 平均事件率（事件/秒）
+        duration: 时长（秒）
+        roi: 事件所在的窗口 (x0, y0, width, height)
+        outside_ratio: 落在窗口外的事件比例，用于测试ROI过滤
+        seed: 随机种子
+
+    Returns:
+        按t排序的事件结构化数组，t单位为微秒
+    """
+    rng = np.random.default_rng(seed)
+    n = int(rate * duration)
+    x0, y0, width, height = roi
+    events = np.empty(n, dtype=EVENT_DTYPE)
+    events['x'] = rng.integers(x0, x0 + width, n)
+    events['y'] = rng.integers(y0, y0 + height, n)
+    if outside_ratio > 0:
+        outside = rng.random(n) < outside_ratio
+        events['x'][outside] = rng.integers(0, x0, outside.sum()) if x0 > 0 else x0 + width
+    events['p'] = rng.integers(0, 2, n)
+    events['t'] = np.sort(rng.integers(0, int(duration * 1e6), n))
+    return events
+
+def synthetic_triggers(frequency=20.0, duration=10.0, pulse_width=1000):
+    """生成成对的上升/下降沿触发信号，与相机外部触发输入一致
+
+    Args:
+        frequency: 触发频率（Hz）
+        duration: 时长（秒）
+        pulse_width: 脉冲宽度（微秒）
+    """
+    rising = np.arange(0, int(duration * 1e6), int(1e6 / frequency), dtype=np.int64)
+    triggers = np.empty(2 * len(rising), dtype=TRIGGER_DTYPE)
+    triggers['t'][0::2] = rising
+    triggers['t'][1::2] = rising + pulse_width
+    triggers['p'][0::2] = 0
+    triggers['p'][1::2] = 1
+    triggers['id'] = 0
+    return triggers
+
+def install_stub_metavision(events, triggers):
+    """用内存中的合成数据替代metavision_core.event_io
+
+    只实现预处理脚本用到的RawReader和EventsIterator接口，需在导入这些脚本之前调用。
+    """
+
+    class RawReader:
+        def __init__(self, record_base, do_time_shifting=True, **kwargs):
+            self.current_time = 0
+            self._pos = 0
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def is_done(self):
+            return self._pos >= len(events)
+
+        def load_delta_t(self, delta_t):
+            self.current_time += int(delta_t)
+            end = np.searchsorted(events['t'], self.current_time, side='left')
+            return self._take(end)
+
+        def load_n_events(self, n_events):
+            end = min(self._pos + int(n_events), len(events))
+            if end > self._pos:
+                self.current_time = int(events['t'][end - 1]) + 1
+            return self._take(end)
+
+        def _take(self, end):
+            # 真实的解码器每批返回新的缓冲区，这里同样拷贝一份
+            batch = events[self._pos:end].copy()
+            self._pos = max(self._pos, end)
+            return batch
+
+        def get_ext_trigger_events(self):
+            return triggers[triggers['t'] < self.current_time].copy()
+
+    class EventsIterator:
+        def __init__(self, input_path, delta_t=10000, start_ts=0, max_duration=None, **kwargs):
+            self.reader = RawReader(input_path)
+            self.delta_t = delta_t
+            self.max_duration = max_duration
+
+        def __iter__(self):
+            while not self.reader.is_done():
+                if self.max_duration is not None and self.reader.current_time >= self.max_duration:
+                    break
+                yield self.reader.load_delta_t(self.delta_t)
+
+        def get_size(self):
+            return 720, 1280
+
+    event_io = types.ModuleType('metavision_core.event_io')
+    event_io.RawReader = RawReader
+    event_io.EventsIterator = EventsIterator
+    core = types.ModuleType('metavision_core')
+    core.event_io = event_io
+    sys.modules['metavision_core'] = core
+    sys.modules['metavision_core.event_io'] = event_io
+
+def _bench_convert(events, triggers, work_dir, **kwargs):
+    from batch_raw2h5 import convert_raw_to_h5
+    suffix = '.events' if kwargs.get('out_format') == 'npy' else '.h5'
+    convert_raw_to_h5('synthetic.raw', os.path.join(work_dir, 'out' + suffix), progress=False, **kwargs)
+
+def _bench_convert_with_triggers(events, triggers, work_dir, **kwargs):
+    from batch_raw2h5 import convert_raw_to_h5_with_triggers
+    convert_raw_to_h5_with_triggers('synthetic.raw', os.path.join(work_dir, 'out.h5'),
+                                    os.path.join(work_dir, 'out.txt'), progress=False, **kwargs)
+
+def _bench_extract_timestamps(events, triggers, work_dir):
+    from found_timestamp import extract_timestamps
+    extract_timestamps('synthetic.raw', os.path.join(work_dir, 'out.txt'))
+
+def _bench_refocus(events, triggers, work_dir, depths=(1.32,)):
+    # 与Event.e_refocus相同：同一遍RawReader解码得到事件和触发信号，再一次遍历累积所有深度
+    from refocus import stack_event_batches, refocus_stack, normalize_refocus_image
+    from metavision_core.event_io import RawReader
+    with RawReader('synthetic.raw') as ev_data:
+        evs = stack_event_batches(ev_data.load_n_events(1000000) for _ in iter(ev_data.is_done, True))
+        ev_data.get_ext_trigger_events()
+    x0, y0, width, height = DEFAULT_ROI
+    stack = refocus_stack(evs['x'].astype(np.int64) - x0, evs['y'].astype(np.int64) - y0, evs['t'],
+                          depths, 383.547, 0.1775, width, height)
+    for counts in stack:
+        normalize_refocus_image(counts)
+
+def _bench_accumulate(events, triggers, work_dir, time_bins=None):
+    from refocus import accumulate_events
+    x0, y0, width, height = DEFAULT_ROI
+    accumulate_events(events['x'].astype(np.int64) - x0, events['y'].astype(np.int64) - y0,
+                      width, height, t=events['t'], time_bins=time_bins)
+
+def _bench_save_timestamps(events, triggers, work_dir, ext='.txt'):
+    from found_timestamp import save_timestamps
+    save_timestamps(os.path.join(work_dir, 'timestamps' + ext), events['t'])
+
+def _bench_load_timestamps(events, triggers, work_dir, ext='.txt'):
+    from found_timestamp import save_timestamps, load_timestamps
+    path = os.path.join(work_dir, 'timestamps' + ext)
+    save_timestamps(path, events['t'])
+    return _timed(load_timestamps, path)
+
+# 名称 -> (函数, 参数)，吞吐量均按合成事件数计算；
+# 时间戳读写用例把事件时间戳当作时间戳序列，因此数量相同
+CASES = {
+    'convert_h5': (_bench_convert, {}),
+    'convert_h5_streaming': (_bench_convert, dict(streaming=True)),
+    'convert_h5_parallel': (_bench_convert, dict(streaming=True, compress_workers=4)),
+    'convert_npy': (_bench_convert, dict(out_format='npy')),
+    'convert_with_triggers': (_bench_convert_with_triggers, dict(streaming=True)),
+    'extract_timestamps': (_bench_extract_timestamps, {}),
+    'refocus_1_depth': (_bench_refocus, {}),
+    'refocus_5_depths': (_bench_refocus, dict(depths=(1.0, 1.2, 1.32, 1.5, 2.0))),
+    'accumulate': (_bench_accumulate, {}),
+    'accumulate_10_bins': (_bench_accumulate, dict(time_bins=10)),
+    'save_timestamps_txt': (_bench_save_timestamps, dict(ext='.txt')),
+    'save_timestamps_npy': (_bench_save_timestamps, dict(ext='.npy')),
+    'load_timestamps_txt': (_bench_load_timestamps, dict(ext='.txt')),
+    'load_timestamps_npy': (_bench_load_timestamps, dict(ext='.npy')),
+}
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+def peak_rss_mb():
+    """当前进程的峰值常驻内存（MB），无法获取时返回None"""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux上单位为KB，macOS上为字节
+        return peak / (1 << 20) if sys.platform == 'darwin' else peak / 1024
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / (1 << 20)
+    except (ImportError, AttributeError):
+        return None
+
+def _run_case(name, config, queue):
+    # 在独立的子进程中运行，峰值内存只反映这一个用例
+    try:
+        queue.put(_measure_case(name, config))
+    except Exception:
+        queue.put({'error': traceback.format_exc()})
+
+def _measure_case(name, config):
+    func, kwargs = CASES[name]
+    events = synthetic_events(config['rate'], config['duration'], outside_ratio=config['outside_ratio'],
+                              seed=config['seed'])
+    triggers = synthetic_triggers(config['trigger_rate'], config['duration'])
+    install_stub_metavision(events, triggers)
+    baseline = peak_rss_mb()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        start = time.perf_counter()
+        # 内部自行计时的用例（如只测读取）返回耗时
+        elapsed = func(events, triggers, work_dir, **kwargs)
+        if elapsed is None:
+            elapsed = time.perf_counter() - start
+    return {'elapsed': elapsed, 'count': len(events), 'baseline_mb': baseline, 'peak_mb': peak_rss_mb()}
+
+def run_benchmark(names, rate=5e6, duration=10.0, trigger_rate=20.0, outside_ratio=0.0, seed=0):
+    """依次在子进程中运行各用例
+
+    用例抛出异常或子进程异常退出时记为失败，不影响后面的用例。
+
+    Returns:
+        {name: {'elapsed': 秒, 'count': 事件数, 'baseline_mb': 运行前峰值内存, 'peak_mb': 峰值内存}}，
+        失败的用例为 {name: {'error': 错误信息}}
+    """
+    config = dict(rate=rate, duration=duration, trigger_rate=trigger_rate, outside_ratio=outside_ratio,
+                  seed=seed)
+    ctx = multiprocessing.get_context('spawn')
+    results = {}
+    for name in names:
+        queue = ctx.Queue()
+        process = ctx.Process(target=_run_case, args=(name, config, queue))
+        process.start()
+        try:
+            results[name] = _wait_result(process, queue)
+        finally:
+            process.join()
+        if 'error' in results[name]:
+            print(f"用例 {name} 失败:\n{results[name]['error']}")
+    return results
+
+def _wait_result(process, queue, poll_interval=1.0):
+    # 子进程被杀死或崩溃时不会放入结果，不能无限等待
+    while True:
+        try:
+            return queue.get(timeout=poll_interval)
+        except Empty:
+            if not process.is_alive():
+                try:
+                    return queue.get(timeout=poll_interval)
+                except Empty:
+                    return {'error': f"子进程异常退出，exitcode={process.exitcode}"}
+
+def _format_mb(value):
+    return '   n/a' if value is None else f"{value:6.0f}"
+
+def print_results(results):
+    print(f"{'用例':<24}{'耗时(s)':>10}{'事件/秒':>14}{'峰值内存(MB)':>14}{'增量(MB)':>10}")
+    for name, r in results.items():
+        if 'error' in r:
+            print(f"{name:<24}{'失败':>10}")
+            continue
+        delta = None if r['peak_mb'] is None else r['peak_mb'] - r['baseline_mb']
+        print(f"{name:<24}{r['elapsed']:>10.3f}{r['count'] / r['elapsed']:>14.3e}"
+              f"{_format_mb(r['peak_mb']):>14}{_format_mb(delta):>10}")
+
+def parse_args():
+    """Defines and parses input arguments"""
+    parser = argparse.ArgumentParser(description="用合成事件流测试预处理脚本的吞吐量和峰值内存")
+    parser.add_argument('-c', '--cases', nargs='+', choices=list(CASES), default=list(CASES),
+                        help='需要运行的用例，默认全部')
+    parser.add_argument('-r', '--rate', type=float, default=5e6,
+                        help='合成事件率（事件/秒）')
+    parser.add_argument('-d', '--duration', type=float, default=10.0,
+                        help='合成事件流时长（秒）')
+    parser.add_argument('--trigger-rate', type=float, default=20.0,
+                        help='触发频率（Hz）')
+    parser.add_argument('--outside-ratio', type=float, default=0.0,
+                        help='落在ROI外的事件比例')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='随机种子')
+    parser.add_argument('--json', default=None,
+                        help='将结果保存为json，便于比较不同版本')
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_args()
+    results = run_benchmark(args.cases, args.rate, args.duration, args.trigger_rate, args.outside_ratio,
+                            args.seed)
+    print_results(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,228 @@
+import os
+import json
+import argparse
+import numpy as np
+from batch_utils import run_jobs, SESSION_FOLDERS
+from file_staging import list_staged
+
+# calib_联合/Demo.m中的boardSize = [7, 9]是方格的行数和列数，
+# OpenCV使用内角点数(列, 行)，即(9 - 1, 7 - 1)
+BOARD_SIZE = (7, 9)
+PATTERN_SIZE = (BOARD_SIZE[1] - 1, BOARD_SIZE[0] - 1)
+
+# 评分缓存文件名，放在image_pairs目录下
+SCORES_NAME = 'checkerboard_scores.json'
+
+# 拉普拉斯方差达到该值时清晰度因子为0.5
+SHARPNESS_HALF = 100.0
+
+def _read_gray(path):
+    import cv2
+    # imdecode可以处理含中文的路径
+    return cv2.imdecode(np.fromfile(path, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+
+def detect_checkerboard(gray, pattern_size=PATTERN_SIZE):
+    """检测棋盘格内角点
+
+    优先使用findChessboardCornersSB（对模糊和噪声更稳健，结果已是亚像素精度），
+    旧版OpenCV退回findChessboardCorners + cornerSubPix。
+
+    Returns:
+        (N, 2)的角点坐标，检测失败时返回None
+    """
+    import cv2
+    if hasattr(cv2, 'findChessboardCornersSB'):
+        found, corners = cv2.findChessboardCornersSB(gray, pattern_size, cv2.CALIB_CB_NORMALIZE_IMAGE)
+    else:
+        found, corners = cv2.findChessboardCorners(
+            gray, pattern_size, cv2.CALIB_CB_ADAPTIVE_THRESH | cv2.CALIB_CB_NORMALIZE_IMAGE)
+        if found:
+            corners = cv2.cornerSubPix(gray, corners, (5, 5), (-1, -1),
+                                       (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.01))
+    return corners.reshape(-1, 2) if found else None
+
+def score_image(path, pattern_size=PATTERN_SIZE):
+    """检测单张图像中的棋盘格并计算评分
+
+    Returns:
+        {'found': 是否检测到, 'corners': 角点列表, 'sharpness': 棋盘区域内的拉普拉斯方差,
+         'coverage': 角点凸包面积占图像面积的比例, 'score': 综合评分(0~1), 'image_size': [宽, 高]}
+    """
+    import cv2
+    gray = _read_gray(path)
+    if gray is None:
+        raise IOError(f"无法读取图像: {path}")
+    image_size = [gray.shape[1], gray.shape[0]]
+    corners = detect_checkerboard(gray, pattern_size)
+    if corners is None:
+        return {'found': False, 'corners': None, 'sharpness': 0.0, 'coverage': 0.0, 'score': 0.0,
+                'image_size': image_size}
+
+    hull = cv2.convexHull(corners.astype(np.float32))
+    coverage = cv2.contourArea(hull) / float(gray.shape[0] * gray.shape[1])
+    # 只在棋盘格区域内计算清晰度，避免背景纹理的影响
+    mask = np.zeros(gray.shape, dtype=np.uint8)
+    cv2.fillConvexPoly(mask, hull.astype(np.int32), 1)
+    laplacian = cv2.Laplacian(gray, cv2.CV_64F)
+    sharpness = float(laplacian[mask > 0].var())
+    score = np.sqrt(coverage) * sharpness / (sharpness + SHARPNESS_HALF)
+    return {'found': True, 'corners': corners.tolist(), 'sharpness': sharpness,
+            'coverage': float(coverage), 'score': float(score), 'image_size': image_size}
+
+def _file_key(path):
+    st = os.stat(path)
+    return {'mtime_ns': st.st_mtime_ns, 'size': st.st_size}
+
+def _score_job(path):
+    return dict(score_image(path), **_file_key(path))
+
+class ScoreCache:
+    """按图像绝对路径保存评分，文件的修改时间或大小变化后重新计算"""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+
+    def get(self, image_path):
+        """返回有效的评分，没有或已过期时返回None"""
+        entry = self.entries.get(os.path.abspath(image_path))
+        if entry is None or not os.path.exists(image_path):
+            return None
+        key = _file_key(image_path)
+        if entry['mtime_ns'] != key['mtime_ns'] or entry['size'] != key['size']:
+            return None
+        return entry
+
+    def set(self, image_path, entry):
+        self.entries[os.path.abspath(image_path)] = entry
+
+    def save(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.path)
+
+def find_pair_folders(image_pairs_dir, folders=SESSION_FOLDERS):
+    """返回image_pairs下按编号排序的各组文件夹"""
+    pair_folders = []
+    for folder in folders:
+        folder_path = os.path.join(image_pairs_dir, folder)
+        if not os.path.exists(folder_path):
+            continue
+        subfolders = sorted([f for f in os.listdir(folder_path) if os.path.isdir(os.path.join(folder_path, f))],
+                            key=int)
+        pair_folders.extend(os.path.join(folder_path, f) for f in subfolders)
+    return pair_folders
+
+def list_pairs(pair_folder):
+    """返回一组文件夹中按编号配对的(RGB图像, 重建图像)路径，与选择器的顺序一致"""
+    rgb_files = list_staged(os.path.join(pair_folder, 'rgb'))
+    recon_files = list_staged(os.path.join(pair_folder, 'event'))
+    rgb_images = sorted(rgb_files, key=lambda x: int(x.split('.')[0]))
+    recon_images = sorted(recon_files, key=lambda x: int(x.split('.')[0]))
+    return list(zip([rgb_files[img] for img in rgb_images], [recon_files[img] for img in recon_images]))
+
+def score_pairs(image_pairs_dir, workers=4, force=False):
+    """用进程池为image_pairs下所有图像评分，结果缓存到checkerboard_scores.json
+
+    Returns:
+        ScoreCache
+    """
+    cache = ScoreCache(os.path.join(image_pairs_dir, SCORES_NAME))
+    paths = [path for pair_folder in find_pair_folders(image_pairs_dir)
+             for pair in list_pairs(pair_folder) for path in pair]
+    todo = [path for path in paths if force or cache.get(path) is None]
+    print(f"共 {len(paths)} 张图像，需要评分 {len(todo)} 张")
+
+    saved = [0]
+
+    def on_result(path, entry):
+        cache.set(path, entry)
+        saved[0] += 1
+        # 定期写回，中断后已完成的部分不需要重算
+        if saved[0] % 200 == 0:
+            cache.save()
+
+    run_jobs(_score_job, [(path, dict(path=path)) for path in todo], workers, desc="棋盘格评分",
+             on_result=on_result)
+    cache.save()
+    return cache
+
+def pair_score(rgb_entry, recon_entry):
+    """图像对的评分：两张图都检测到棋盘格时取较低的一张，否则为0"""
+    if not rgb_entry or not recon_entry or not (rgb_entry['found'] and recon_entry['found']):
+        return 0.0
+    return min(rgb_entry['score'], recon_entry['score'])
+
+def pose_descriptor(corners, image_size):
+    """由角点描述棋盘格的位姿：中心位置、大小、朝向和透视程度
+
+    Args:
+        corners: PATTERN_SIZE顺序的角点
+        image_size: (宽, 高)
+    """
+    corners = np.asarray(corners, dtype=np.float64)
+    cols, rows = PATTERN_SIZE
+    grid = corners.reshape(rows, cols, 2)
+    width, height = image_size
+    center = corners.mean(axis=0) / [width, height]
+    top, bottom = grid[0, -1] - grid[0, 0], grid[-1, -1] - grid[-1, 0]
+    left, right = grid[-1, 0] - grid[0, 0], grid[-1, -1] - grid[0, -1]
+    size = np.linalg.norm(top) / width
+    angle = np.arctan2(top[1], top[0])
+    # 对边长度之比反映棋盘格相对相机的倾斜
+    tilt_x = np.log(np.linalg.norm(left) / np.linalg.norm(right))
+    tilt_y = np.log(np.linalg.norm(top) / np.linalg.norm(bottom))
+    return np.array([center[0], center[1], size, np.sin(angle), np.cos(angle), tilt_x, tilt_y])
+
+def select_diverse(candidates, k):
+    """从候选中选出评分高且位姿差异大的k个
+
+    先取评分最高的一个，之后每次选择 评分 * 与已选位姿的最小距离 最大的候选。
+
+    Args:
+        candidates: [(评分, 位姿描述), ...]
+        k: 需要选择的数量
+
+    Returns:
+        被选中候选的下标列表
+    """
+    if not candidates or k <= 0:
+        return []
+    scores = np.array([score for score, _ in candidates])
+    poses = np.array([pose for _, pose in candidates])
+    # 各维度按标准差归一化，使位置、大小、倾斜的权重相当
+    poses = poses / np.maximum(poses.std(axis=0), 1e-6)
+    chosen = [int(np.argmax(scores))]
+    min_dist = np.linalg.norm(poses - poses[chosen[0]], axis=1)
+    while len(chosen) < min(k, len(candidates)):
+        gain = scores * min_dist
+        gain[chosen] = -1
+        best = int(np.argmax(gain))
+        if gain[best] <= 0:
+            break
+        chosen.append(best)
+        min_dist = np.minimum(min_dist, np.linalg.norm(poses - poses[best], axis=1))
+    return chosen
+
+def parse_args():
+    """Defines and parses input arguments"""
+    parser = argparse.ArgumentParser(description="检测image_pairs中每张图像的棋盘格并评分")
+    parser.add_argument('-i', '--input-dir', default="./image_pairs",
+                        help='copy_image_pairs输出的image_pairs目录')
+    parser.add_argument('-w', '--workers', type=int, default=4,
+                        help='并行检测的进程数')
+    parser.add_argument('-f', '--force', action='store_true',
+                        help='忽略缓存，重新评分所有图像')
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_args()
+    cache = score_pairs(args.input_dir, args.workers, args.force)
+    for pair_folder in find_pair_folders(args.input_dir):
+        pairs = list_pairs(pair_folder)
+        usable = sum(pair_score(cache.get(rgb), cache.get(recon)) > 0 for rgb, recon in pairs)
+        print(f"{pair_folder}: 两个相机都检测到棋盘格的图像对 {usable}/{len(pairs)}")
@@ -0,0 +1,127 @@
+import os
+import argparse
+import numpy as np
+from batch_utils import run_jobs, atomic_output, SESSION_FOLDERS
+
+# 去马赛克方法
+#   vng: 边缘更清晰，速度较慢
+#   bilinear: 双线性插值，速度快
+DEBAYER_METHODS = ('vng', 'bilinear')
+
+# FLIR脚本save_format为'tiff'或'npy'时Master/RGB中的帧格式，image_pairs.py只读取PNG，需先转换
+FRAME_EXTS = ('.tiff', '.npy')
+
+def _color_code(method):
+    # OpenCV的Bayer命名与相机的像素排列错开一位：对BayerRG8（RGGB）使用RG2BGR得到的是R,G,B顺序的数组
+    import cv2
+    if method == 'vng':
+        return cv2.COLOR_BAYER_RG2BGR_VNG
+    if method == 'bilinear':
+        return cv2.COLOR_BAYER_RG2BGR
+    raise ValueError(f"未知的去马赛克方法: {method}")
+
+def debayer_frame(src, dst, method='vng', png_level=1):
+    """把一帧原始Bayer图像(.npy，每像素1字节)转换为RGB图像并保存为PNG
+
+    转换得到R,G,B顺序的数组后直接imwrite，与RGB8Packed采集时保存的图像一致
+    （两者在PNG中红蓝通道都是互换的），同一数据集中两种采集方式的图像颜色相同。
+    """
+    import cv2
+    bayer = np.load(src)
+    if bayer.ndim != 2 or bayer.dtype != np.uint8:
+        raise ValueError(f"不是8位Bayer图像: {src} {bayer.shape} {bayer.dtype}")
+    _write_png(dst, cv2.cvtColor(bayer, _color_code(method)), png_level, src)
+
+def convert_frame(src, dst, png_level=1):
+    """把Master/RGB中以tiff或npy保存的帧转换为PNG，数组原样写出，与直接保存PNG的结果相同"""
+    import cv2
+    if src.endswith('.npy'):
+        image = np.load(src)
+    else:
+        # imdecode可以处理含中文的路径
+        image = cv2.imdecode(np.fromfile(src, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+    if image is None:
+        raise IOError(f"无法读取图像: {src}")
+    _write_png(dst, image, png_level, src)
+
+def _write_png(dst, image, png_level, src):
+    import cv2
+    ok, data = cv2.imencode('.png', image, [cv2.IMWRITE_PNG_COMPRESSION, png_level])
+    if not ok:
+        raise IOError(f"无法编码图像: {src}")
+    # 先写临时文件，中断时不会在RGB目录中留下半张图像
+    with atomic_output(dst) as tmp_path:
+        data.tofile(tmp_path)
+
+def find_master_folders(base_dir, folders=SESSION_FOLDERS):
+    """查找各session子文件夹中FLIR脚本保存的Master目录"""
+    pairs = []
+    for folder in folders:
+        folder_path = os.path.join(base_dir, folder)
+        if not os.path.exists(folder_path):
+            print(f"跳过 {folder_path} - 文件夹不存在")
+            continue
+        subfolders = [f for f in os.listdir(folder_path) if os.path.isdir(os.path.join(folder_path, f))]
+        subfolders.sort(key=int)  # 确保按数字顺序排序
+        for subfolder in subfolders:
+            master = os.path.join(folder_path, subfolder, 'Master')
+            if os.path.isdir(master):
+                pairs.append(master)
+    return pairs
+
+def debayer_folders(base_dir, method='vng', workers=4, force=False, png_level=1):
+    """用进程池把采集的帧转换为Master/RGB/{i}.png，供image_pairs.py使用
+
+    Master/Bayer/{i}.npy去马赛克，Master/RGB/{i}.tiff或{i}.npy直接转换为PNG。
+    输出已存在且不早于原始帧时跳过，除非force为True。
+
+    Returns:
+        失败任务列表 [(原始帧路径, 错误信息), ...]
+    """
+    jobs = []
+    total = 0
+    for master in find_master_folders(base_dir):
+        bayer_dir = os.path.join(master, 'Bayer')
+        rgb_dir = os.path.join(master, 'RGB')
+        sources = []
+        if os.path.isdir(bayer_dir):
+            sources.extend((os.path.join(bayer_dir, name), True) for name in os.listdir(bayer_dir)
+                           if name.endswith('.npy'))
+        if os.path.isdir(rgb_dir):
+            sources.extend((os.path.join(rgb_dir, name), False) for name in os.listdir(rgb_dir)
+                           if name.endswith(FRAME_EXTS))
+        if sources:
+            os.makedirs(rgb_dir, exist_ok=True)
+        for src, is_bayer in sources:
+            total += 1
+            dst = os.path.join(rgb_dir, os.path.splitext(os.path.basename(src))[0] + '.png')
+            if not force and os.path.exists(dst) and os.path.getmtime(dst) >= os.path.getmtime(src):
+                continue
+            if is_bayer:
+                jobs.append((src, dict(func=debayer_frame, src=src, dst=dst, method=method, png_level=png_level)))
+            else:
+                jobs.append((src, dict(func=convert_frame, src=src, dst=dst, png_level=png_level)))
+    print(f"共 {total} 帧需要转换为PNG的图像，需要转换 {len(jobs)} 帧")
+    return run_jobs(_convert_job, jobs, workers, desc="转换为PNG")
+
+def _convert_job(func, **kwargs):
+    return func(**kwargs)
+
+def parse_args():
+    """Defines and parses input arguments"""
+    parser = argparse.ArgumentParser(description="将FLIR采集的原始Bayer帧及tiff/npy帧转换为RGB PNG图像")
+    parser.add_argument('-i', '--input-dir', default="",
+                        help='采集数据的基础路径（包含1.10和1.11文件夹）')
+    parser.add_argument('-m', '--method', choices=DEBAYER_METHODS, default='vng',
+                        help='去马赛克方法：vng质量较好，bilinear速度较快')
+    parser.add_argument('-w', '--workers', type=int, default=4,
+                        help='并行转换的进程数')
+    parser.add_argument('-f', '--force', action='store_true',
+                        help='重新转换已存在的RGB图像')
+    parser.add_argument('--png-level', type=int, default=1,
+                        help='PNG压缩级别0~9，越小越快')
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_args()
+    debayer_folders(args.input_dir, args.method, args.workers, args.force, args.png_level)
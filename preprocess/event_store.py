@@ -0,0 +1,147 @@
+import os
+import h5py
+import numpy as np
+
+try:
+    # 注册Blosc等第三方压缩过滤器，读取以blosc编码写入的文件时需要
+    import hdf5plugin
+except ImportError:
+    hdf5plugin = None
+
+def open_npy_events(events_dir, mmap=True):
+    """打开batch_convert以npy格式输出的{i}.events目录
+
+    Args:
+        events_dir: 包含x.npy, y.npy, p.npy, t.npy的目录
+        mmap: 为True时内存映射文件，只有实际访问的部分才会从磁盘读取
+
+    Returns:
+        {'x': ..., 'y': ..., 'p': ..., 't': ...}
+    """
+    mmap_mode = 'r' if mmap else None
+    return {name: np.load(os.path.join(events_dir, name + '.npy'), mmap_mode=mmap_mode)
+            for name in ('x', 'y', 'p', 't')}
+
+def slice_time_window(events, t0, t1):
+    """取出时间戳在[t0, t1)内的事件
+
+    t按时间有序，用二分查找定位区间；对内存映射的数组返回的是视图，不拷贝数据。
+
+    Args:
+        events: open_npy_events返回的列字典
+        t0, t1: 时间窗口（微秒）
+    """
+    start, end = np.searchsorted(events['t'], [t0, t1], side='left')
+    return {name: column[start:end] for name, column in events.items()}
+
+# 时间索引的默认间隔（微秒）
+DEFAULT_INDEX_STEP = 1000
+
+class TimeIndexBuilder:
+    """在逐批写入事件时构建粗粒度的时间->偏移索引
+
+    offsets[k]为第一个时间戳不小于origin + k * step的事件位置，
+    查询时间窗口时只需读取索引定位到的那一小段t。
+    """
+
+    def __init__(self, step=DEFAULT_INDEX_STEP):
+        self.step = step
+        self.origin = None
+        self.offsets = []
+        self.num_bins = 0
+
+    def update(self, t, start):
+        """登记一批事件
+
+        Args:
+            t: 本批事件的时间戳（有序）
+            start: 本批第一个事件在整个文件中的位置
+        """
+        if len(t) == 0:
+            return
+        if self.origin is None:
+            self.origin = int(t[0]) // self.step * self.step
+        next_k = self.num_bins
+        last_k = (int(t[-1]) - self.origin) // self.step
+        if last_k < next_k:
+            return
+        bounds = self.origin + np.arange(next_k, last_k + 1, dtype=np.int64) * self.step
+        self.offsets.append(start + np.searchsorted(t, bounds, side='left'))
+        self.num_bins = last_k + 1
+
+    def result(self):
+        """返回(origin, step, offsets)"""
+        offsets = np.concatenate(self.offsets) if self.offsets else np.zeros(0, dtype=np.int64)
+        return (self.origin or 0), self.step, offsets.astype(np.int64)
+
+def write_time_index(f, builder):
+    """将时间索引写入h5文件的t_index数据集"""
+    origin, step, offsets = builder.result()
+    dset = f.create_dataset('t_index', data=offsets)
+    dset.attrs['origin'] = origin
+    dset.attrs['step'] = step
+
+def events_between(source, t0, t1):
+    """读取时间戳在[t0, t1)内的事件，只读取需要的片段
+
+    h5文件有t_index时只读取索引中的两项和对应的一小段t来定位区间；
+    没有索引的旧文件退化为读取整个t后二分查找。
+
+    Args:
+        source: h5文件路径、已打开的h5py.File，或npy格式的{i}.events目录
+        t0, t1: 时间窗口（微秒）
+
+    Returns:
+        {'x': ..., 'y': ..., 'p': ..., 't': ...}
+    """
+    if isinstance(source, h5py.File):
+        return _h5_events_between(source, t0, t1)
+    if os.path.isdir(source):
+        return slice_time_window(open_npy_events(source), t0, t1)
+    with h5py.File(source, 'r') as f:
+        return _h5_events_between(f, t0, t1)
+
+def events_around_triggers(source, trigger_times, before, after):
+    """依次取出每个触发时刻附近[t - before, t + after)的事件，用于逐帧重建
+
+    Args:
+        source: 同events_between
+        trigger_times: 触发时间戳（微秒）
+        before, after: 触发时刻前后的窗口长度（微秒）
+
+    Yields:
+        (触发时间, 事件列字典)
+    """
+    if isinstance(source, str) and not os.path.isdir(source):
+        with h5py.File(source, 'r') as f:
+            yield from events_around_triggers(f, trigger_times, before, after)
+        return
+    for t in trigger_times:
+        yield t, events_between(source, t - before, t + after)
+
+def _h5_events_between(f, t0, t1):
+    t = f['t']
+    n = t.shape[0]
+    if 't_index' in f:
+        index = f['t_index']
+        origin = int(index.attrs['origin'])
+        step = int(index.attrs['step'])
+        num_bins = index.shape[0]
+
+        def offset(k):
+            # 第k个索引点之前的事件都早于origin + k * step
+            if k <= 0:
+                return 0
+            if k >= num_bins:
+                return n
+            return int(index[k])
+
+        coarse_start = offset((t0 - origin) // step)
+        coarse_end = offset(-((origin - t1) // step))
+    else:
+        coarse_start, coarse_end = 0, n
+
+    t_coarse = t[coarse_start:coarse_end]
+    start, end = coarse_start + np.searchsorted(t_coarse, [t0, t1], side='left')
+    return {'x': f['x'][start:end], 'y': f['y'][start:end], 'p': f['p'][start:end],
+            't': t_coarse[start - coarse_start:end - coarse_start]}
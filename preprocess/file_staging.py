@@ -0,0 +1,204 @@
+import os
+import json
+import errno
+import shutil
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from tqdm import tqdm
+
+# 整理/挑选图像对时放置文件的方式
+#   copy: shutil.copy2完整复制
+#   hardlink: 硬链接，只增加目录项；跨文件系统时退回复制
+#   reflink: 写时复制的克隆（Btrfs/XFS等），不支持时退回复制
+#   manifest: 不写图像文件，只在目标目录的sources.json中记录源路径
+LINK_MODES = ('copy', 'hardlink', 'reflink', 'manifest')
+
+# manifest模式下每个目标目录中的源路径清单
+SOURCES_NAME = 'sources.json'
+
+# Linux的FICLONE ioctl，见ioctl_ficlone(2)
+_FICLONE = 0x40049409
+
+# 这些错误表示当前文件系统不支持链接/克隆，应退回复制
+_UNSUPPORTED = (errno.EXDEV, errno.EPERM, errno.EINVAL, errno.ENOTTY, errno.EOPNOTSUPP, errno.EMLINK)
+
+def _reflink(src, dst):
+    import fcntl
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+    shutil.copystat(src, dst)
+
+def place_file(src, dst, mode='copy'):
+    """按mode将src放到dst，已存在的dst会被替换
+
+    Args:
+        src: 源文件
+        dst: 目标文件路径
+        mode: 'copy', 'hardlink'或'reflink'
+
+    Returns:
+        实际使用的方式，不支持链接而退回复制时为'copy'
+    """
+    if os.path.lexists(dst):
+        # 硬链接不能覆盖已有文件；复制时也先删除，避免改写与源文件共享的inode
+        os.remove(dst)
+    if mode == 'hardlink':
+        try:
+            os.link(src, dst)
+            return 'hardlink'
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED:
+                raise
+    elif mode == 'reflink':
+        try:
+            _reflink(src, dst)
+            return 'reflink'
+        except (OSError, ImportError) as e:
+            if isinstance(e, OSError) and e.errno not in _UNSUPPORTED:
+                raise
+            if os.path.exists(dst):
+                os.remove(dst)
+    elif mode != 'copy':
+        raise ValueError(f"未知的放置方式: {mode}")
+    shutil.copy2(src, dst)
+    return 'copy'
+
+def stage_files(items, dst_dir, mode='copy'):
+    """将一组文件放到同一个目标目录
+
+    Args:
+        items: [(源文件, 目标文件名), ...]
+        dst_dir: 目标目录
+        mode: LINK_MODES之一
+
+    Returns:
+        {实际使用的方式: 文件数}
+    """
+    os.makedirs(dst_dir, exist_ok=True)
+    if mode == 'manifest':
+        # 删除之前复制过来的同名文件，否则list_staged会优先返回旧文件
+        for _, name in items:
+            if os.path.lexists(os.path.join(dst_dir, name)):
+                os.remove(os.path.join(dst_dir, name))
+        sources = read_sources(dst_dir)
+        sources.update({name: os.path.abspath(src) for src, name in items})
+        write_sources(dst_dir, sources)
+        return {'manifest': len(items)}
+    counts = {}
+    for src, name in items:
+        used = place_file(src, os.path.join(dst_dir, name), mode)
+        counts[used] = counts.get(used, 0) + 1
+    return counts
+
+def read_sources(dst_dir):
+    """读取目标目录中的sources.json，不存在时返回空字典"""
+    path = os.path.join(dst_dir, SOURCES_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def write_sources(dst_dir, sources):
+    path = os.path.join(dst_dir, SOURCES_NAME)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(sources, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def list_staged(dst_dir, exts=('.png',)):
+    """列出目标目录中的文件，包括manifest模式只记录在sources.json中的文件
+
+    Returns:
+        {文件名: 可直接读取的路径}，目录中真实存在的文件优先
+    """
+    staged = {name: src for name, src in read_sources(dst_dir).items() if name.endswith(exts)}
+    if os.path.isdir(dst_dir):
+        for name in os.listdir(dst_dir):
+            if name.endswith(exts):
+                staged[name] = os.path.join(dst_dir, name)
+    return staged
+
+def file_digest(path, block_size=1 << 20):
+    """计算文件的sha1"""
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def verify_file(src, dst, verify='size'):
+    """检查放置后的文件是否与源文件一致，不一致时抛出IOError
+
+    Args:
+        verify: None不检查，'size'比较文件大小，'checksum'同时比较sha1
+    """
+    if verify is None:
+        return
+    src_size, dst_size = os.path.getsize(src), os.path.getsize(dst)
+    if src_size != dst_size:
+        raise IOError(f"大小不一致: {src} ({src_size}) -> {dst} ({dst_size})")
+    # 硬链接指向同一个文件，无需再读一遍
+    if verify == 'checksum' and not os.path.samefile(src, dst) and file_digest(src) != file_digest(dst):
+        raise IOError(f"校验和不一致: {src} -> {dst}")
+
+def _stage_one(src, dst, mode, verify):
+    used = place_file(src, dst, mode)
+    verify_file(src, dst, verify)
+    return used
+
+def stage_parallel(tasks, mode='copy', workers=8, verify='size', desc="放置文件"):
+    """用线程池并行放置文件，适合单个文件延迟较高的网络存储
+
+    同时在途的任务数限制为4 * workers，整个任务列表共用一个进度条；
+    单个文件失败不影响其他文件。
+
+    Args:
+        tasks: [(源文件, 目标文件路径), ...]，目标目录需已存在
+        mode: 'copy', 'hardlink'或'reflink'
+        workers: 线程数，小于等于1时在当前线程中依次执行
+        verify: 放置后的检查方式，见verify_file
+        desc: 进度条描述
+
+    Returns:
+        ({实际使用的方式: 文件数}, [(目标文件, 错误信息), ...])
+    """
+    counts = {}
+    failures = []
+
+    def finish(dst, future=None, used=None, error=None):
+        if future is not None:
+            try:
+                used = future.result()
+            except Exception as e:
+                error = str(e)
+        if error is None:
+            counts[used] = counts.get(used, 0) + 1
+        else:
+            failures.append((dst, error))
+        pbar.update(1)
+        pbar.set_postfix(failed=len(failures))
+
+    with tqdm(total=len(tasks), desc=desc) as pbar:
+        if workers <= 1:
+            for src, dst in tasks:
+                try:
+                    finish(dst, used=_stage_one(src, dst, mode, verify))
+                except Exception as e:
+                    finish(dst, error=str(e))
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                pending = {}
+                for src, dst in tasks:
+                    if len(pending) >= 4 * workers:
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            finish(pending.pop(future), future)
+                    pending[executor.submit(_stage_one, src, dst, mode, verify)] = dst
+                for future in wait(pending)[0]:
+                    finish(pending[future], future)
+
+    if failures:
+        print(f"{len(failures)}/{len(tasks)} 个文件失败:")
+        for dst, error in failures:
+            print(f"  {dst}: {error}")
+    return counts, failures
@@ -1,6 +1,8 @@
 import os
+import argparse
+import numpy as np
 from metavision_core.event_io import RawReader
-from tqdm import tqdm
+from batch_utils import find_raw_files, run_jobs
 
 def extract_timestamps(raw_path, txt_path, polarity=0, do_time_shifting=True):
     """从raw文件中提取时间戳并保存到txt文件
@@ -14,33 +16,81 @@ def extract_timestamps(raw_path, txt_path, polarity=0, do_time_shifting=True):
     print(f"处理文件: {raw_path}")
     
     try:
-        with RawReader(str(raw_path), do_time_shifting=do_time_shifting) as ev_data:
-            while not ev_data.is_done():
-                ev_data.load_n_events(1000000)
-            triggers = ev_data.get_ext_trigger_events()
-        
-        if len(triggers) > 0:
-            print(f"总触发信号数量: {len(triggers)}")
-            print(f"首个触发: p={triggers['p'][0]}, t={triggers['t'][0]}")
-            print(f"末个触发: p={triggers['p'][-1]}, t={triggers['t'][-1]}")
-
-            if polarity in (0, 1):
-                triggers = triggers[triggers['p'] == polarity].copy()
-            
-            # 保存时间戳到txt文件
-            os.makedirs(os.path.dirname(txt_path), exist_ok=True)
-            with open(txt_path, 'w') as f:
-                for i, t in enumerate(triggers['t']):
-                    f.write(f"{t}\n")
-            
-            print(f"已保存时间戳到: {txt_path}")
-        else:
-            print("未检测到触发信号")
+        triggers = read_trigger_events(raw_path, do_time_shifting)
+        save_trigger_timestamps(triggers, txt_path, polarity)
+        print(f"已保存时间戳到: {txt_path}")
             
     except Exception as e:
         print(f"处理失败: {e}")
 
-def batch_process_timestamps(base_input_dir, base_output_dir, polarity=0, do_time_shifting=False):
+def read_trigger_events(raw_path, do_time_shifting=True):
+    """解码raw文件并返回全部外部触发信号"""
+    with RawReader(str(raw_path), do_time_shifting=do_time_shifting) as ev_data:
+        while not ev_data.is_done():
+            ev_data.load_n_events(1000000)
+        return ev_data.get_ext_trigger_events()
+
+def _extract_timestamps_job(raw_path, txt_path, polarity, do_time_shifting):
+    # 批处理任务中不捕获异常，由run_jobs统一收集
+    print(f"处理文件: {raw_path}")
+    triggers = read_trigger_events(raw_path, do_time_shifting)
+    save_trigger_timestamps(triggers, txt_path, polarity)
+    print(f"已保存时间戳到: {txt_path}")
+
+def save_trigger_timestamps(triggers, txt_path, polarity=0):
+    """按极性筛选触发信号并将时间戳保存到文件
+    
+    没有触发信号时也写出空文件，批处理可以据此判断该文件已处理。
+    
+    Args:
+        triggers: get_ext_trigger_events()返回的触发信号结构化数组
+        txt_path: 保存时间戳的文件路径，扩展名为.npy时保存为二进制数组，否则为每行一个时间戳的txt
+        polarity: 触发极性，0为正，1为负，其他值表示不筛选
+    """
+    if len(triggers) > 0:
+        print(f"总触发信号数量: {len(triggers)}")
+        print(f"首个触发: p={triggers['p'][0]}, t={triggers['t'][0]}")
+        print(f"末个触发: p={triggers['p'][-1]}, t={triggers['t'][-1]}")
+
+        if polarity in (0, 1):
+            triggers = triggers[triggers['p'] == polarity]
+    else:
+        print("未检测到触发信号")
+    save_timestamps(txt_path, triggers['t'])
+
+def save_timestamps(path, timestamps):
+    """一次性写出整数时间戳（微秒）
+    
+    Args:
+        path: 输出路径，扩展名为.npy时保存为int64二进制数组，否则为每行一个时间戳的txt
+        timestamps: 时间戳数组
+    """
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    if path.endswith('.npy'):
+        np.save(path, timestamps)
+    else:
+        # 整体格式化后一次写入，避免逐行write
+        with open(path, 'w') as f:
+            if len(timestamps) > 0:
+                f.write('\n'.join(map(str, timestamps.tolist())) + '\n')
+
+def load_timestamps(path):
+    """读取save_timestamps保存的时间戳
+    
+    Args:
+        path: .npy或每行一个整数时间戳的txt文件
+    
+    Returns:
+        int64时间戳数组（微秒）
+    """
+    if path.endswith('.npy'):
+        return np.load(path).astype(np.int64, copy=False)
+    # 由numpy在C层解析整个文件，不逐行调用Python
+    return np.fromfile(path, dtype=np.int64, sep=' ')
+
+def batch_process_timestamps(base_input_dir, base_output_dir, polarity=0, do_time_shifting=False, workers=1,
+                             ext='.txt'):
     """批量处理文件夹下的所有raw文件的时间戳
     
     Args:
@@ -48,42 +98,44 @@ def batch_process_timestamps(base_input_dir, base_output_dir, polarity=0, do_tim
         base_output_dir: 输出目录（h5data）
         polarity: 触发极性
         do_time_shifting: 是否进行时间偏移
+        workers: 并行处理的进程数，1为逐个处理
+        ext: 输出文件扩展名，'.txt'或'.npy'
+    
+    Returns:
+        处理失败的文件列表 [(名称, 错误信息), ...]
     """
-    # 处理1.10和1.11两个文件夹
-    for folder in ['1.10', '1.11']:
-        input_base = os.path.join(base_input_dir, folder)
+    jobs = []
+    for folder, i, raw_file in find_raw_files(base_input_dir):
         output_base = os.path.join(base_output_dir, folder)
-        
-        if not os.path.exists(input_base):
-            print(f"跳过 {input_base} - 文件夹不存在")
-            continue
-            
         os.makedirs(output_base, exist_ok=True)
-            
-        # 遍历子文件夹（1,2,3...）
-        subfolders = [f for f in os.listdir(input_base) if os.path.isdir(os.path.join(input_base, f))]
-        subfolders.sort(key=int)  # 确保按数字顺序排序
         
-        for i, subfolder in enumerate(tqdm(subfolders, desc=f"处理 {folder}"), 1):
-            event_folder = os.path.join(input_base, subfolder, 'event')
-            if not os.path.exists(event_folder):
-                print(f"跳过 {event_folder} - 文件夹不存在")
-                continue
-                
-            # 查找event.raw文件
-            raw_file = os.path.join(event_folder, 'event.raw')
-            if not os.path.exists(raw_file):
-                print(f"跳过 {raw_file} - 文件不存在")
-                continue
-            
-            # 设置输出txt文件路径（保存到h5data目录）
-            txt_file = os.path.join(output_base, f"{i}.txt")
-            extract_timestamps(raw_file, txt_file, polarity, do_time_shifting)
+        # 设置输出文件路径（保存到h5data目录）
+        txt_file = os.path.join(output_base, f"{i}{ext}")
+        jobs.append((f"{folder}/{i}", dict(raw_path=raw_file, txt_path=txt_file, polarity=polarity,
+                                            do_time_shifting=do_time_shifting)))
+    
+    return run_jobs(_extract_timestamps_job, jobs, workers, desc="提取时间戳")
+
+def parse_args():
+    """Defines and parses input arguments"""
+    parser = argparse.ArgumentParser(description="批量提取raw文件中的触发时间戳")
+    parser.add_argument('-i', '--input-dir', default="",
+                        help='数据所在的基础路径（包含1.10和1.11文件夹）')
+    parser.add_argument('-o', '--output-dir', default="./h5data",
+                        help='时间戳输出目录')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='并行处理的进程数，每个raw文件由一个进程处理')
+    parser.add_argument('--npy', action='store_true',
+                        help='以二进制.npy格式保存时间戳，可用load_timestamps直接读取')
+    return parser.parse_args()
 
 if __name__ == '__main__':
+    args = parse_args()
+    
     # 设置输入和输出目录路径
-    base_input_dir = ""  # 请修改为你的数据所在的基础路径
-    base_output_dir = "./h5data"  # 输出到h5data目录
+    base_input_dir = args.input_dir  # 数据所在的基础路径
+    base_output_dir = args.output_dir  # 输出到h5data目录
     
     # 批量处理时间戳
-    batch_process_timestamps(base_input_dir, base_output_dir, polarity=0, do_time_shifting=False)
+    batch_process_timestamps(base_input_dir, base_output_dir, polarity=0, do_time_shifting=False,
+                             workers=args.workers, ext='.npy' if args.npy else '.txt')
\ No newline at end of file
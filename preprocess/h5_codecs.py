@@ -0,0 +1,119 @@
+import zlib
+from collections import deque
+import numpy as np
+
+# 各列默认使用gzip-1，与原先的输出一致
+DEFAULT_CODECS = {'x': 'gzip', 'y': 'gzip', 'p': 'gzip', 't': 'gzip'}
+
+# 可以由ParallelChunkWriter在线程池中自行压缩的编码
+DIRECT_CHUNK_CODECS = ('none', 'gzip', 'shuffle-gzip')
+
+def codec_options(codec):
+    """返回h5py.create_dataset使用的压缩参数
+
+    Args:
+        codec: 编码名称
+            'none': 不压缩
+            'gzip': deflate-1
+            'lzf': lzf，速度快、压缩率较低
+            'shuffle-gzip': 字节重排后deflate-1，适合多字节整数
+            'scaleoffset-gzip': 每个分块减去块内最小值并按最少位数存储后再deflate-1，
+                适合单调递增的t，效果接近差分编码且读取时无需额外处理
+            'blosc-lz4', 'blosc-zstd': Blosc多线程压缩（位重排），需要安装hdf5plugin，
+                线程数由环境变量BLOSC_NTHREADS控制
+    """
+    if codec == 'none':
+        return {}
+    if codec == 'gzip':
+        return dict(compression='gzip', compression_opts=1)
+    if codec == 'lzf':
+        return dict(compression='lzf')
+    if codec == 'shuffle-gzip':
+        return dict(shuffle=True, compression='gzip', compression_opts=1)
+    if codec == 'scaleoffset-gzip':
+        return dict(scaleoffset=0, compression='gzip', compression_opts=1)
+    if codec in ('blosc-lz4', 'blosc-zstd'):
+        try:
+            import hdf5plugin
+        except ImportError:
+            raise ImportError(f"编码 {codec} 需要安装hdf5plugin: pip install hdf5plugin")
+        return dict(hdf5plugin.Blosc(cname=codec.split('-')[1], clevel=5,
+                                     shuffle=hdf5plugin.Blosc.BITSHUFFLE))
+    raise ValueError(f"未知的编码: {codec}")
+
+def parse_codecs(specs):
+    """解析命令行中的COLUMN=CODEC列表，未指定的列使用默认编码"""
+    codecs = dict(DEFAULT_CODECS)
+    for spec in specs or []:
+        column, codec = spec.split('=', 1)
+        if column not in codecs:
+            raise ValueError(f"未知的列: {column}")
+        codec_options(codec)  # 提前检查编码是否可用
+        codecs[column] = codec
+    return codecs
+
+def _encode_chunk(chunk, codec):
+    if codec == 'none':
+        return chunk.tobytes()
+    if codec == 'shuffle-gzip':
+        # 与HDF5 shuffle过滤器相同：先放所有元素的第0字节，再放第1字节……
+        chunk = chunk.view(np.uint8).reshape(-1, chunk.itemsize).T
+    # zlib在压缩时释放GIL，因此多个线程可以真正并行
+    return zlib.compress(np.ascontiguousarray(chunk).tobytes(), 1)
+
+class ParallelChunkWriter:
+    """在线程池中压缩完整的分块，再用write_direct_chunk按顺序写入数据集
+
+    数据集需以codec_options(codec)和固定的chunks创建，codec需在DIRECT_CHUNK_CODECS中。
+    HDF5自身的过滤器流水线是单线程的，这里绕过它自行压缩。
+    """
+
+    def __init__(self, dset, codec, executor, max_pending=8):
+        self.dset = dset
+        self.codec = codec
+        self.executor = executor
+        self.chunk_size = dset.chunks[0]
+        self.buffer = np.empty(self.chunk_size, dtype=dset.dtype)
+        self.filled = 0
+        self.count = 0
+        self.next_chunk = 0
+        self.pending = deque()
+        self.max_pending = max_pending
+
+    def append(self, data):
+        pos = 0
+        while pos < len(data):
+            n = min(self.chunk_size - self.filled, len(data) - pos)
+            self.buffer[self.filled:self.filled + n] = data[pos:pos + n]
+            self.filled += n
+            pos += n
+            if self.filled == self.chunk_size:
+                self._submit()
+        self.count += len(data)
+
+    def _submit(self):
+        chunk = self.buffer[:self.filled].copy()
+        if self.filled < self.chunk_size:
+            # HDF5的分块总是完整大小，末尾补零，超出数据集范围的部分不会被读到
+            chunk = np.concatenate([chunk, np.zeros(self.chunk_size - self.filled, dtype=chunk.dtype)])
+        future = self.executor.submit(_encode_chunk, chunk, self.codec)
+        self.pending.append((self.next_chunk, future))
+        self.next_chunk += 1
+        self.filled = 0
+        # 限制在途的分块数量，避免压缩跟不上时内存无限增长
+        while len(self.pending) > self.max_pending:
+            self._write_oldest()
+
+    def _write_oldest(self):
+        index, future = self.pending.popleft()
+        offset = index * self.chunk_size
+        if self.dset.shape[0] < offset + self.chunk_size:
+            self.dset.resize((offset + self.chunk_size,))
+        self.dset.id.write_direct_chunk((offset,), future.result(), 0)
+
+    def close(self):
+        if self.filled:
+            self._submit()
+        while self.pending:
+            self._write_oldest()
+        self.dset.resize((self.count,))
@@ -1,6 +1,10 @@
 import os
-import shutil
-from tqdm import tqdm
+import numpy as np
+from file_staging import stage_files, stage_parallel
+from thumbnail_cache import build_thumbnails, CACHE_DIR_NAME
+from debayer import FRAME_EXTS
+from match_timestamps import (load_flir_timestamps, load_trigger_timestamps, match_frames_to_triggers,
+                              save_pair_table, summarize_pairs)
 
 def natural_sort_key(s):
     """提取文件名中的数字用于排序"""
@@ -11,13 +15,67 @@ def natural_sort_key(s):
         return int(numbers[0])
     return 0
 
-def copy_image_pairs(base_dir, output_dir):
+def find_trigger_timestamps(event_folder):
+    """返回事件文件夹中保存的触发时间戳文件，没有时返回None"""
+    for name in ('TimeStamps.npy', 'TimeStamps.txt'):
+        path = os.path.join(event_folder, name)
+        if os.path.exists(path):
+            return path
+    return None
+
+def match_image_pairs(rgb_images, recon_images, frame_ts_path, trigger_ts_path, table_path=None):
+    """按时间戳配对RGB图像和重建图像
+    
+    RGB图像{i}.png对应FLIR TimeStamps.txt中的第i个时间戳，按文件名中的序号查找，
+    因此采集时丢弃的帧（只有时间戳没有图像）不会使后面的配对错位；
+    第j张重建图像对应第j个触发信号。
+    
+    Args:
+        rgb_images, recon_images: 按序号排序的图像文件名
+        frame_ts_path: FLIR的Master/TimeStamps.txt
+        trigger_ts_path: 事件相机的触发时间戳文件
+        table_path: 配对表保存路径，为None时不保存；表中的frame_index为RGB图像的序号
+    
+    Returns:
+        [(rgb图像, 重建图像), ...]
+    """
+    all_frame_t = load_flir_timestamps(frame_ts_path)
+    numbered = {natural_sort_key(name): name for name in rgb_images}
+    rows = np.array(sorted(i for i in numbered if i < len(all_frame_t)), dtype=np.int64)
+    if len(rows) < len(numbered):
+        print(f"{len(numbered) - len(rows)} 张RGB图像没有对应的时间戳，已忽略")
+    frame_t = all_frame_t[rows]
+    trigger_t = load_trigger_timestamps(trigger_ts_path)[:len(recon_images)]
+    pairs, model = match_frames_to_triggers(frame_t, trigger_t)
+    summarize_pairs(pairs, len(frame_t), len(trigger_t), model)
+    # 换回TimeStamps.txt中的行号，即RGB图像的序号
+    pairs['frame_index'] = rows[pairs['frame_index']]
+    if table_path is not None:
+        save_pair_table(table_path, pairs, model)
+    return [(numbered[f], recon_images[t])
+            for f, t in zip(pairs['frame_index'].tolist(), pairs['trigger_index'].tolist())]
+
+def copy_image_pairs(base_dir, output_dir, match=False, link_mode='copy', workers=8, verify='size',
+                     thumbnails=False):
     """整理并复制图像对
     
+    先遍历所有文件夹得到完整的文件列表，再由线程池统一放置，共用一个进度条。
+    
     Args:
         base_dir: 根目录路径
         output_dir: 输出目录路径
+        match: 为True时按FLIR帧时间戳和事件触发时间戳配对，并保存pairs.csv；
+            缺少时间戳文件时退回按序号配对
+        link_mode: 放置图像的方式，'copy', 'hardlink', 'reflink'或'manifest'，见file_staging
+        workers: 并行放置文件的线程数，网络存储上单个文件的延迟较高时可适当增大
+        verify: 放置后的检查方式，None, 'size'或'checksum'
+        thumbnails: 为True时同时在output_dir/.thumbnails中生成select_image_pair使用的缩略图（需要OpenCV）
+    
+    Returns:
+        放置失败的文件列表 [(目标文件, 错误信息), ...]
     """
+    tasks = []
+    manifest_paths = []  # manifest模式下选择器直接打开的源文件
     # 创建输出目录结构
     for folder in ['1.10', '1.11']:
         folder_path = os.path.join(output_dir, folder)
@@ -32,7 +90,7 @@ def copy_image_pairs(base_dir, output_dir):
         subfolders.sort(key=int)  # 确保按数字顺序排序
         
         print(f"处理 {folder} 文件夹...")
-        for i, subfolder in enumerate(tqdm(subfolders), 1):
+        for i, subfolder in enumerate(subfolders, 1):
             # RGB图像路径
             rgb_folder = os.path.join(rgb_base, subfolder, 'Master', 'RGB')
             # 重建图像路径
@@ -45,6 +103,8 @@ def copy_image_pairs(base_dir, output_dir):
             # 获取图像列表并按数字顺序排序
             rgb_images = [f for f in os.listdir(rgb_folder) if f.endswith(('.png', '.jpg', '.jpeg'))]
             recon_images = [f for f in os.listdir(recon_folder) if f.endswith(('.png', '.jpg', '.jpeg'))]
+            if not rgb_images and any(f.endswith(FRAME_EXTS) for f in os.listdir(rgb_folder)):
+                print(f"{subfolder} 的RGB帧以tiff/npy保存，请先运行debayer.py转换为PNG")
             
             rgb_images.sort(key=natural_sort_key)
             recon_images.sort(key=natural_sort_key)
@@ -56,22 +116,62 @@ def copy_image_pairs(base_dir, output_dir):
             os.makedirs(rgb_output, exist_ok=True)
             os.makedirs(recon_output, exist_ok=True)
             
-            # 复制RGB图像
-            for j, img in enumerate(rgb_images):
-                src = os.path.join(rgb_folder, img)
-                dst = os.path.join(rgb_output, f"{j+1}.png")
-                shutil.copy2(src, dst)
+            frame_ts_path = os.path.join(rgb_base, subfolder, 'Master', 'TimeStamps.txt')
+            trigger_ts_path = find_trigger_timestamps(os.path.join(rgb_base, subfolder, 'event'))
+            if match and os.path.exists(frame_ts_path) and trigger_ts_path is not None:
+                # 按时间戳配对，丢帧只影响对应的一对，输出序号保持连续
+                try:
+                    pairs = match_image_pairs(rgb_images, recon_images, frame_ts_path, trigger_ts_path,
+                                              os.path.join(pair_folder, 'pairs.csv'))
+                    rgb_images = [rgb for rgb, _ in pairs]
+                    recon_images = [recon for _, recon in pairs]
+                except ValueError as e:
+                    # 图像或时间戳太少时无法估计时钟关系，不影响其他文件夹
+                    print(f"{subfolder} 无法按时间戳配对（{e}），按序号配对")
+            elif match:
+                print(f"{subfolder} 缺少时间戳文件，按序号配对")
             
-            # 复制重建图像
-            for j, img in enumerate(recon_images):
-                src = os.path.join(recon_folder, img)
-                dst = os.path.join(recon_output, f"{j+1}.png")
-                shutil.copy2(src, dst)
+            rgb_items = [(os.path.join(rgb_folder, img), f"{j+1}.png") for j, img in enumerate(rgb_images)]
+            recon_items = [(os.path.join(recon_folder, img), f"{j+1}.png") for j, img in enumerate(recon_images)]
+            if link_mode == 'manifest':
+                # 只写sources.json，无需线程池
+                stage_files(rgb_items, rgb_output, link_mode)
+                stage_files(recon_items, recon_output, link_mode)
+                manifest_paths.extend(src for src, _ in rgb_items + recon_items)
+            else:
+                tasks.extend((src, os.path.join(rgb_output, name)) for src, name in rgb_items)
+                tasks.extend((src, os.path.join(recon_output, name)) for src, name in recon_items)
             
-            print(f"完成 {folder}/{subfolder} - RGB: {len(rgb_images)}张, 重建: {len(recon_images)}张")
+            print(f"整理 {folder}/{subfolder} - RGB: {len(rgb_images)}张, 重建: {len(recon_images)}张")
+    
+    failures = []
+    if tasks:
+        counts, failures = stage_parallel(tasks, link_mode, workers, verify, desc="放置图像")
+        print("放置方式: " + ", ".join(f"{mode} {n}张" for mode, n in counts.items()))
+    
+    if thumbnails:
+        # 缩略图以选择器将要打开的路径为键
+        failed = {dst for dst, _ in failures}
+        paths = manifest_paths + [dst for _, dst in tasks if dst not in failed]
+        build_thumbnails(paths, os.path.join(output_dir, CACHE_DIR_NAME), workers=workers)
+    return failures
 
 if __name__ == '__main__':
     base_dir = "."  # 当前目录
     output_dir = "./image_pairs"  # 输出目录
     
-    copy_image_pairs(base_dir, output_dir)
+    # 为True时按时间戳配对，避免丢帧导致之后的图像对整体错位
+    match = True
+    
+    # 硬链接只增加目录项，不额外占用磁盘；跨文件系统时自动退回复制
+    link_mode = 'hardlink'
+    
+    # 需要复制时的并行线程数，以及放置后是否校验（'size'或'checksum'）
+    workers = 8
+    verify = 'size'
+    
+    # 为True时同时生成选择器使用的缩略图，打开和切换文件夹时无需解码原图
+    thumbnails = True
+    
+    copy_image_pairs(base_dir, output_dir, match=match, link_mode=link_mode, workers=workers, verify=verify,
+                     thumbnails=thumbnails)
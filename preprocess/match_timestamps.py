@@ -0,0 +1,189 @@
+import os
+import re
+import argparse
+import numpy as np
+
+# 配对表的字段：帧序号、触发序号、两侧时间戳（微秒）、按时钟模型换算后的残差（微秒）
+PAIR_DTYPE = np.dtype([('frame_index', '<i8'), ('trigger_index', '<i8'), ('frame_t', '<f8'),
+                       ('trigger_t', '<f8'), ('residual', '<f8')])
+
+_TIMESTAMP_PATTERN = re.compile(r'Timestamp:\s*([-+0-9.eE]+)')
+
+def load_flir_timestamps(path):
+    """读取FLIR脚本保存的Master/TimeStamps.txt
+
+    每行格式为'Timestamp:{秒} {i}.jpg'，时间来自相机的chunk时间戳。
+
+    Returns:
+        float64时间戳数组（微秒），第i项对应RGB/{i}.png
+    """
+    with open(path, 'r') as f:
+        seconds = _TIMESTAMP_PATTERN.findall(f.read())
+    return np.array(seconds, dtype=np.float64) * 1e6
+
+def load_trigger_timestamps(path):
+    """读取事件相机的触发时间戳
+
+    支持Event.py保存的TimeStamps.npy（微秒）和'Timestamp:{秒}'格式的TimeStamps.txt，
+    以及found_timestamp.py输出的每行一个整数（微秒）的txt或npy。
+
+    Returns:
+        float64时间戳数组（微秒）
+    """
+    # 与found_timestamp.load_timestamps相同的格式，这里不导入它以免依赖metavision
+    if path.endswith('.npy'):
+        return np.load(path).astype(np.float64)
+    with open(path, 'r') as f:
+        text = f.read()
+    if 'Timestamp:' in text:
+        return np.array(_TIMESTAMP_PATTERN.findall(text), dtype=np.float64) * 1e6
+    return np.array(text.split(), dtype=np.float64)
+
+def _nearest(sorted_t, query):
+    """返回sorted_t中与每个query最近的元素下标"""
+    idx = np.searchsorted(sorted_t, query)
+    idx = np.clip(idx, 1, len(sorted_t) - 1)
+    left = sorted_t[idx - 1]
+    right = sorted_t[idx]
+    return idx - ((query - left) < (right - query))
+
+def _residuals(frame_t, trigger_t, scale, offset):
+    predicted = frame_t * scale + offset
+    nearest = _nearest(trigger_t, predicted)
+    return nearest, trigger_t[nearest] - predicted
+
+def estimate_clock_model(frame_t, trigger_t, tolerance=None, num_candidates=8, iterations=3):
+    """估计两个时钟之间的线性关系 trigger_t ≈ frame_t * scale + offset
+
+    先用开头若干帧与触发的两两时间差作为候选偏移，取内点最多的一个；
+    再在内点上做最小二乘拟合得到漂移（scale）并迭代剔除外点。
+    候选覆盖了前num_candidates个位置的组合，因此开头多出的帧或触发能被时间间隔识别出来。
+    周期完全均匀时，整周期的错位无法只靠时间区分，内点数相同时假定第一帧对应第一个触发。
+
+    Args:
+        frame_t: 帧时间戳（微秒，有序）
+        trigger_t: 触发时间戳（微秒，有序）
+        tolerance: 判断为同一次曝光的最大残差（微秒），默认取触发周期中位数的1/4
+        num_candidates: 参与候选偏移的开头帧数和触发数
+        iterations: 拟合-剔除的迭代次数
+
+    Returns:
+        (scale, offset, tolerance)
+    """
+    frame_t = np.asarray(frame_t, dtype=np.float64)
+    trigger_t = np.asarray(trigger_t, dtype=np.float64)
+    if len(frame_t) < 2 or len(trigger_t) < 2:
+        raise ValueError("帧或触发时间戳少于2个，无法估计时钟关系")
+    if tolerance is None:
+        tolerance = np.median(np.diff(trigger_t)) / 4
+
+    # 候选偏移：开头num_candidates帧与开头num_candidates个触发的两两差值
+    k = min(num_candidates, len(frame_t), len(trigger_t))
+    candidates = (trigger_t[:k, None] - frame_t[None, :k]).ravel()
+    shifts = np.abs(np.arange(k)[:, None] - np.arange(k)[None, :]).ravel()
+    inliers = [np.count_nonzero(np.abs(_residuals(frame_t, trigger_t, 1.0, c)[1]) < tolerance)
+               for c in candidates]
+    # 内点最多者优先，相同时取序号错位最小的候选
+    best = np.lexsort((shifts, -np.asarray(inliers)))[0]
+    scale, offset = 1.0, candidates[best]
+
+    for _ in range(iterations):
+        nearest, residual = _residuals(frame_t, trigger_t, scale, offset)
+        mask = np.abs(residual) < tolerance
+        if np.count_nonzero(mask) < 2:
+            break
+        # 以第一帧为原点拟合，避免大时间戳带来的数值问题
+        origin = frame_t[mask][0]
+        slope, intercept = np.polyfit(frame_t[mask] - origin, trigger_t[nearest[mask]], 1)
+        scale, offset = slope, intercept - slope * origin
+    return scale, offset, tolerance
+
+def match_frames_to_triggers(frame_t, trigger_t, tolerance=None, model=None):
+    """将每一帧匹配到最近的触发信号，得到显式的配对表
+
+    帧或触发有缺失时只影响缺失的那一项，后面的配对不会整体错位。
+    一个触发被多帧匹配到时只保留残差最小的一帧。
+
+    Args:
+        frame_t: 帧时间戳（微秒）
+        trigger_t: 触发时间戳（微秒）
+        tolerance: 最大残差（微秒），默认同estimate_clock_model
+        model: (scale, offset, tolerance)，为None时自动估计
+
+    Returns:
+        (pairs, model)，pairs为PAIR_DTYPE结构化数组，按帧序号排序
+    """
+    frame_t = np.asarray(frame_t, dtype=np.float64)
+    trigger_t = np.asarray(trigger_t, dtype=np.float64)
+    if model is None:
+        model = estimate_clock_model(frame_t, trigger_t, tolerance)
+    scale, offset, tolerance = model
+
+    nearest, residual = _residuals(frame_t, trigger_t, scale, offset)
+    frames = np.flatnonzero(np.abs(residual) < tolerance)
+    # 按(触发序号, |残差|)排序后每个触发取第一帧，保证一一对应
+    order = np.lexsort((np.abs(residual[frames]), nearest[frames]))
+    frames = frames[order]
+    first = np.ones(len(frames), dtype=bool)
+    first[1:] = nearest[frames][1:] != nearest[frames][:-1]
+    frames = np.sort(frames[first])
+
+    pairs = np.empty(len(frames), dtype=PAIR_DTYPE)
+    pairs['frame_index'] = frames
+    pairs['trigger_index'] = nearest[frames]
+    pairs['frame_t'] = frame_t[frames]
+    pairs['trigger_t'] = trigger_t[nearest[frames]]
+    pairs['residual'] = residual[frames]
+    return pairs, model
+
+def save_pair_table(path, pairs, model=None):
+    """将配对表保存为csv，时钟模型写在注释行中"""
+    lines = []
+    if model is not None:
+        scale, offset, tolerance = model
+        lines.append(f"# scale={float(scale)!r} offset={float(offset)!r} tolerance={float(tolerance)!r} "
+                     f"drift_ppm={(scale - 1) * 1e6:.3f}\n")
+    lines.append(','.join(PAIR_DTYPE.names) + '\n')
+    lines.extend(f"{f},{t},{ft:.3f},{tt:.3f},{r:.3f}\n" for f, t, ft, tt, r in pairs.tolist())
+    with open(path, 'w') as f:
+        f.write(''.join(lines))
+
+def load_pair_table(path):
+    """读取save_pair_table保存的配对表"""
+    with open(path, 'r') as f:
+        # 跳过注释行和表头
+        lines = [line for line in f if not line.startswith('#')][1:]
+    return np.loadtxt(lines, delimiter=',', dtype=PAIR_DTYPE, ndmin=1)
+
+def summarize_pairs(pairs, num_frames, num_triggers, model):
+    """打印匹配结果的统计信息"""
+    scale, offset, tolerance = model
+    print(f"时钟模型: offset={offset:.1f}us, 漂移={(scale - 1) * 1e6:.3f}ppm")
+    print(f"配对数: {len(pairs)}，未匹配帧: {num_frames - len(pairs)}，"
+          f"未匹配触发: {num_triggers - len(pairs)}")
+    if len(pairs):
+        abs_residual = np.abs(pairs['residual'])
+        print(f"残差: 平均 {abs_residual.mean():.1f}us，最大 {abs_residual.max():.1f}us")
+
+def parse_args():
+    """Defines and parses input arguments"""
+    parser = argparse.ArgumentParser(description="按时间戳将FLIR帧与事件相机触发信号配对")
+    parser.add_argument('-f', '--frames', required=True,
+                        help='FLIR的Master/TimeStamps.txt')
+    parser.add_argument('-t', '--triggers', required=True,
+                        help='事件相机触发时间戳（TimeStamps.npy/TimeStamps.txt或found_timestamp输出）')
+    parser.add_argument('-o', '--output', default='pairs.csv',
+                        help='配对表输出路径')
+    parser.add_argument('--tolerance', type=float, default=None,
+                        help='最大残差（微秒），默认取触发周期中位数的1/4')
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_args()
+    frame_t = load_flir_timestamps(args.frames)
+    trigger_t = load_trigger_timestamps(args.triggers)
+    pairs, model = match_frames_to_triggers(frame_t, trigger_t, args.tolerance)
+    summarize_pairs(pairs, len(frame_t), len(trigger_t), model)
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    save_pair_table(args.output, pairs, model)
+    print(f"已保存配对表到: {args.output}")
@@ -1,19 +1,166 @@
 import sys
 import os
-import shutil
+import threading
+from collections import OrderedDict, deque
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                             QHBoxLayout, QPushButton, QLabel, QListWidget, 
                             QMessageBox, QProgressBar, QShortcut)
 from PyQt5.QtGui import QPixmap, QImage, QKeySequence
-from PyQt5.QtCore import Qt, QSize
+from PyQt5.QtCore import Qt, QSize, QThread, pyqtSignal
+from file_staging import stage_files, list_staged
+from thumbnail_cache import thumbnail_path, CACHE_DIR_NAME
+from checkerboard_score import ScoreCache, SCORES_NAME, pair_score, pose_descriptor, select_diverse
+from selection_state import SelectionJournal, OutputIndex, JOURNAL_NAME
+
+# 保存选中图像对到pair2calib的方式，见file_staging.LINK_MODES
+# 标定程序需要读取真实的图像文件，因此这里默认使用硬链接而不是manifest
+LINK_MODE = 'hardlink'
+
+# 图像显示区域的大小
+DISPLAY_SIZE = 500
+
+# 向前、向后各预读的图像对数
+PREFETCH_PAIRS = 3
+
+# 缩放后图像缓存的上限（字节），500x500的ARGB图像约1MB
+CACHE_BYTES = 256 * 1024 * 1024
+
+# image_pairs目录及其中的缩略图目录
+IMAGE_PAIRS_DIR = "./image_pairs"
+THUMBNAIL_DIR = os.path.join(IMAGE_PAIRS_DIR, CACHE_DIR_NAME)
+
+# 保存选中图像对的目录
+OUTPUT_DIR = "./pair2calib"
+
+# 自动选择时每个文件夹选出的图像对数（calib_联合/Demo.m使用前20对）
+AUTO_SELECT_K = 20
+
+def load_scaled_image(path, size=DISPLAY_SIZE, cache_dir=THUMBNAIL_DIR):
+    """读取缩放到显示大小的图像
+
+    优先读取磁盘上的缩略图（由copy_image_pairs生成，或之前打开时写入），
+    没有时解码原图并缩放，再写入缩略图供下次使用。
+    使用QImage而不是QPixmap，因此可以在非UI线程中调用。
+    """
+    thumb_path = thumbnail_path(path, cache_dir, size)
+    image = QImage(thumb_path)
+    if not image.isNull():
+        return image
+    image = QImage(path).scaled(size, size, Qt.KeepAspectRatio)
+    os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+    # 先写临时文件再重命名，预读线程与UI线程同时写同一张时不会互相破坏
+    tmp_path = thumb_path + f'.{threading.get_ident()}.tmp'
+    if image.save(tmp_path, 'JPG', 95):
+        os.replace(tmp_path, thumb_path)
+    return image
+
+class ImagePrefetcher(threading.Thread):
+    """后台线程：提前解码并缩放即将显示的图像，放入按字节数限制大小的LRU缓存
+
+    每次导航后调用request()给出新的预读列表，尚未处理的旧请求会被丢弃。
+    """
+
+    def __init__(self, size=DISPLAY_SIZE, max_bytes=CACHE_BYTES):
+        super().__init__(daemon=True)
+        self.size = size
+        self.max_bytes = max_bytes
+        self.cache = OrderedDict()
+        self.cache_bytes = 0
+        self.pending = deque()
+        self.condition = threading.Condition()
+        self.stopped = False
+
+    def get(self, path):
+        """返回缓存中缩放后的图像，不存在时返回None"""
+        with self.condition:
+            image = self.cache.get(path)
+            if image is not None:
+                self.cache.move_to_end(path)
+            return image
+
+    def put(self, path, image):
+        with self.condition:
+            if path in self.cache:
+                self.cache_bytes -= self.cache.pop(path).sizeInBytes()
+            self.cache[path] = image
+            self.cache_bytes += image.sizeInBytes()
+            # 淘汰最久未使用的图像
+            while self.cache_bytes > self.max_bytes and len(self.cache) > 1:
+                _, old = self.cache.popitem(last=False)
+                self.cache_bytes -= old.sizeInBytes()
+
+    def request(self, paths):
+        """替换待预读的图像列表，越靠前越先处理"""
+        with self.condition:
+            self.pending = deque(p for p in paths if p not in self.cache)
+            self.condition.notify()
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.pending and not self.stopped:
+                    self.condition.wait()
+                if self.stopped:
+                    return
+                path = self.pending.popleft()
+                if path in self.cache:
+                    continue
+            try:
+                image = load_scaled_image(path, self.size)
+            except Exception as e:
+                # 单张图像缺失或无法读取时跳过，预读线程继续处理后面的图像
+                print(f"预读失败: {path}: {e}")
+                continue
+            self.put(path, image)
+
+class SaveWorker(QThread):
+    """在后台线程中把选中的图像对放到pair2calib，完成后发出saved信号"""
+
+    # (已保存的图像对列表, 起始编号, 错误信息，成功时为空字符串)
+    saved = pyqtSignal(object, int, str)
+
+    def __init__(self, pairs, output_index, output_dir=OUTPUT_DIR, link_mode=LINK_MODE):
+        super().__init__()
+        self.pairs = pairs
+        self.output_index = output_index
+        self.output_dir = output_dir
+        self.link_mode = link_mode
+
+    def run(self):
+        start_number = self.output_index.next_number
+        try:
+            # RGB图像到flir文件夹，重建图像到event文件夹
+            numbered = list(enumerate(self.pairs, start_number))
+            stage_files([(rgb_path, f"{i}.png") for i, (rgb_path, _) in numbered],
+                        os.path.join(self.output_dir, "flir"), self.link_mode)
+            stage_files([(recon_path, f"{i}.png") for i, (_, recon_path) in numbered],
+                        os.path.join(self.output_dir, "event"), self.link_mode)
+            self.output_index.record(start_number, self.pairs)
+        except Exception as e:
+            self.saved.emit(self.pairs, start_number, str(e))
+            return
+        self.saved.emit(self.pairs, start_number, '')
 
 class ImagePairSelector(QMainWindow):
-    def __init__(self):
+    def __init__(self, link_mode=LINK_MODE):
         super().__init__()
+        self.link_mode = link_mode
+        self.prefetcher = ImagePrefetcher()
+        self.prefetcher.start()
         self.initUI()
         self.current_folder = None
         self.current_index = 0
         self.selected_pairs = set()  # 记录已选择的图像对
+        self.journal = SelectionJournal(os.path.join(IMAGE_PAIRS_DIR, JOURNAL_NAME))  # 选择日志，崩溃后可恢复
+        self.output_index = None  # pair2calib的编号索引，第一次保存时加载
+        self.save_worker = None
+        self.scores = None  # checkerboard_score.py生成的棋盘格评分，没有时为None
+        self.only_detected = False  # 为True时只显示两个相机都检测到棋盘格的图像对
         self.setup_shortcuts()  # 添加这行
         
     def setup_shortcuts(self):
@@ -41,6 +188,13 @@ class ImagePairSelector(QMainWindow):
         self.shortcut_next_folder = QShortcut(QKeySequence('D'), self)
         self.shortcut_next_folder.activated.connect(self.next_folder)
         
+        # F键：只显示可检测的图像对；K键：自动选择
+        self.shortcut_filter = QShortcut(QKeySequence('F'), self)
+        self.shortcut_filter.activated.connect(self.filter_btn.click)
+        
+        self.shortcut_auto_select = QShortcut(QKeySequence('K'), self)
+        self.shortcut_auto_select.activated.connect(self.auto_select)
+        
     def initUI(self):
         self.setWindowTitle('图像对选择器')
         self.setGeometry(100, 100, 1200, 800)
@@ -64,6 +218,18 @@ class ImagePairSelector(QMainWindow):
         self.save_btn.setEnabled(False)
         top_layout.addWidget(self.save_btn)
         
+        # 棋盘格评分相关按钮，需要先运行checkerboard_score.py
+        self.filter_btn = QPushButton('只显示可检测的图像对', self)
+        self.filter_btn.setCheckable(True)
+        self.filter_btn.toggled.connect(self.set_only_detected)
+        self.filter_btn.setEnabled(False)
+        top_layout.addWidget(self.filter_btn)
+        
+        self.auto_select_btn = QPushButton(f'自动选择前{AUTO_SELECT_K}对', self)
+        self.auto_select_btn.clicked.connect(self.auto_select)
+        self.auto_select_btn.setEnabled(False)
+        top_layout.addWidget(self.auto_select_btn)
+        
         layout.addLayout(top_layout)
         
         # 创建图像显示区域
@@ -143,7 +309,7 @@ class ImagePairSelector(QMainWindow):
         
     def load_folders(self):
         """加载文件夹"""
-        base_dir = "./image_pairs"
+        base_dir = IMAGE_PAIRS_DIR
         if not os.path.exists(base_dir):
             QMessageBox.warning(self, '错误', 'image_pairs文件夹不存在！')
             return
@@ -159,6 +325,17 @@ class ImagePairSelector(QMainWindow):
                     full_path = os.path.join(folder_path, subfolder)
                     self.folders.append(full_path)
         
+        # 恢复上次未保存的选择
+        self.selected_pairs = self.journal.load()
+        if self.selected_pairs:
+            print(f"已恢复 {len(self.selected_pairs)} 对未保存的选择")
+        
+        scores_path = os.path.join(base_dir, SCORES_NAME)
+        if os.path.exists(scores_path):
+            self.scores = ScoreCache(scores_path)
+            self.filter_btn.setEnabled(True)
+            self.auto_select_btn.setEnabled(True)
+        
         if self.folders:
             self.current_folder = 0
             self.load_current_folder()
@@ -176,15 +353,18 @@ class ImagePairSelector(QMainWindow):
         rgb_path = os.path.join(folder, 'rgb')
         recon_path = os.path.join(folder, 'event')
         
-        rgb_images = sorted([f for f in os.listdir(rgb_path) if f.endswith('.png')],
-                          key=lambda x: int(x.split('.')[0]))
-        recon_images = sorted([f for f in os.listdir(recon_path) if f.endswith('.png')],
-                            key=lambda x: int(x.split('.')[0]))
+        # image_pairs以manifest方式整理时，图像只记录在sources.json中
+        rgb_files = list_staged(rgb_path)
+        recon_files = list_staged(recon_path)
+        rgb_images = sorted(rgb_files, key=lambda x: int(x.split('.')[0]))
+        recon_images = sorted(recon_files, key=lambda x: int(x.split('.')[0]))
         
         self.current_pairs = list(zip(
-            [os.path.join(rgb_path, img) for img in rgb_images],
-            [os.path.join(recon_path, img) for img in recon_images]
+            [rgb_files[img] for img in rgb_images],
+            [recon_files[img] for img in recon_images]
         ))
+        if self.only_detected and self.scores is not None:
+            self.current_pairs = [pair for pair in self.current_pairs if self.pair_score(pair) > 0]
         
         self.current_index = 0
         self.update_display()
@@ -192,22 +372,21 @@ class ImagePairSelector(QMainWindow):
         
     def update_display(self):
         if not self.current_pairs:
+            self.rgb_image.clear()
+            self.recon_image.clear()
+            self.progress_label.setText('当前文件夹没有可显示的图像对')
             return
             
         rgb_path, recon_path = self.current_pairs[self.current_index]
         
-        # 显示RGB图像
-        pixmap = QPixmap(rgb_path)
-        pixmap = pixmap.scaled(500, 500, Qt.KeepAspectRatio)
-        self.rgb_image.setPixmap(pixmap)
-        
-        # 显示重建图像
-        pixmap = QPixmap(recon_path)
-        pixmap = pixmap.scaled(500, 500, Qt.KeepAspectRatio)
-        self.recon_image.setPixmap(pixmap)
+        # 显示RGB图像和重建图像
+        self.rgb_image.setPixmap(self.scaled_pixmap(rgb_path))
+        self.recon_image.setPixmap(self.scaled_pixmap(recon_path))
+        self.prefetch_neighbors()
         
         # 更新进度显示，添加更详细的文件夹信息
-        folder_path = os.path.dirname(os.path.dirname(rgb_path))
+        # 用当前文件夹而不是图像路径，manifest方式整理时图像路径指向原始数据
+        folder_path = self.folders[self.current_folder]
         main_folder = os.path.basename(os.path.dirname(folder_path))  # 1.10 或 1.11
         sub_folder = os.path.basename(folder_path)  # 子文件夹编号
         
@@ -215,12 +394,85 @@ class ImagePairSelector(QMainWindow):
             f'当前位置: {main_folder}/{sub_folder}\n'
             f'图像进度: {self.current_index + 1}/{len(self.current_pairs)}\n'
             f'文件夹进度: {self.current_folder + 1}/{len(self.folders)}'
+            + self.score_text(rgb_path, recon_path)
         )
         
         # 更新选择按钮状态
         pair_key = (rgb_path, recon_path)
         self.select_btn.setText('取消选择' if pair_key in self.selected_pairs else '选择此对')
         
+    def pair_score(self, pair):
+        rgb_path, recon_path = pair
+        return pair_score(self.scores.get(rgb_path), self.scores.get(recon_path))
+        
+    def score_text(self, rgb_path, recon_path):
+        """当前图像对的棋盘格检测结果"""
+        if self.scores is None:
+            return ''
+        parts = []
+        for name, path in (('RGB', rgb_path), ('事件', recon_path)):
+            entry = self.scores.get(path)
+            if entry is None:
+                parts.append(f'{name}: 未评分')
+            elif not entry['found']:
+                parts.append(f'{name}: 未检测到')
+            else:
+                parts.append(f"{name}: 清晰度 {entry['sharpness']:.0f}, 覆盖 {entry['coverage']:.0%}")
+        return f"\n棋盘格评分 {self.pair_score((rgb_path, recon_path)):.2f} | " + ' | '.join(parts)
+        
+    def set_only_detected(self, checked):
+        """切换是否只显示两个相机都检测到棋盘格的图像对"""
+        self.only_detected = checked
+        if self.folders:
+            self.load_current_folder()
+        
+    def auto_select(self):
+        """在当前文件夹中选择评分高且棋盘格位姿差异大的AUTO_SELECT_K对"""
+        if self.scores is None or not self.current_pairs:
+            return
+        candidates = []
+        pairs = []
+        for pair in self.current_pairs:
+            score = self.pair_score(pair)
+            if score > 0:
+                entry = self.scores.get(pair[0])
+                candidates.append((score, pose_descriptor(entry['corners'], entry['image_size'])))
+                pairs.append(pair)
+        chosen = [pairs[i] for i in select_diverse(candidates, AUTO_SELECT_K)]
+        for pair in chosen:
+            if pair not in self.selected_pairs:
+                self.selected_pairs.add(pair)
+                self.journal.add(pair)
+        print(f"自动选择了 {len(chosen)} 对图像")
+        self.update_display()
+        
+    def scaled_pixmap(self, path):
+        """优先使用预读缓存，未命中时在当前线程解码；读取失败时返回空图像"""
+        image = self.prefetcher.get(path)
+        if image is None:
+            try:
+                image = load_scaled_image(path)
+            except Exception as e:
+                print(f"无法读取图像: {path}: {e}")
+                return QPixmap()
+            self.prefetcher.put(path, image)
+        return QPixmap.fromImage(image)
+        
+    def prefetch_neighbors(self):
+        """预读当前位置前后PREFETCH_PAIRS对图像，先下一对、再上一对，依次向外"""
+        paths = []
+        for step in range(1, PREFETCH_PAIRS + 1):
+            for index in (self.current_index + step, self.current_index - step):
+                if 0 <= index < len(self.current_pairs):
+                    paths.extend(self.current_pairs[index])
+        self.prefetcher.request(paths)
+        
+    def closeEvent(self, event):
+        if self.save_worker is not None:
+            self.save_worker.wait()
+        self.prefetcher.stop()
+        super().closeEvent(event)
+        
     def update_controls(self):
         self.prev_btn.setEnabled(self.current_index > 0)
         self.next_btn.setEnabled(self.current_index < len(self.current_pairs) - 1)
@@ -245,58 +497,50 @@ class ImagePairSelector(QMainWindow):
         pair_key = self.current_pairs[self.current_index]
         if pair_key in self.selected_pairs:
             self.selected_pairs.remove(pair_key)
+            self.journal.remove(pair_key)
         else:
             self.selected_pairs.add(pair_key)
+            self.journal.add(pair_key)
         self.update_display()
         
     def save_selected_pairs(self):
+        if self.save_worker is not None:
+            return
         if not self.selected_pairs:
             QMessageBox.warning(self, '警告', '请先选择要保存的图像对！')
             return
-            
-        # 创建保存目录
-        output_dir = "./pair2calib"
-        event_dir = os.path.join(output_dir, "event")
-        flir_dir = os.path.join(output_dir, "flir")
-        os.makedirs(event_dir, exist_ok=True)
-        os.makedirs(flir_dir, exist_ok=True)
-        
-        # 获取已存在的最大编号
-        existing_numbers = []
-        if os.path.exists(event_dir):
-            existing_numbers.extend([
-                int(f.split('.')[0]) for f in os.listdir(event_dir)
-                if f.endswith('.png') and f.split('.')[0].isdigit()
-            ])
-        if os.path.exists(flir_dir):
-            existing_numbers.extend([
-                int(f.split('.')[0]) for f in os.listdir(flir_dir)
-                if f.endswith('.png') and f.split('.')[0].isdigit()
-            ])
-        
-        # 确定起始编号
-        start_number = max(existing_numbers, default=0) + 1
-        
-        # 保存选中的图像对
-        for i, (rgb_path, recon_path) in enumerate(sorted(self.selected_pairs), start_number):
-            # 复制RGB图像到flir文件夹
-            dst_rgb = os.path.join(flir_dir, f"{i}.png")
-            shutil.copy2(rgb_path, dst_rgb)
-            
-            # 复制重建图像到event文件夹
-            dst_recon = os.path.join(event_dir, f"{i}.png")
-            shutil.copy2(recon_path, dst_recon)
+        
+        # 编号从索引中分配，不再每次扫描输出目录
+        if self.output_index is None:
+            self.output_index = OutputIndex(OUTPUT_DIR)
+        
+        # 在后台线程中保存，界面可以继续浏览和选择
+        self.save_btn.setEnabled(False)
+        self.save_btn.setText('保存中...')
+        self.save_worker = SaveWorker(sorted(self.selected_pairs), self.output_index, OUTPUT_DIR, self.link_mode)
+        self.save_worker.saved.connect(self.on_pairs_saved)
+        self.save_worker.start()
+        
+    def on_pairs_saved(self, pairs, start_number, error):
+        self.save_worker.wait()
+        self.save_worker = None
+        self.save_btn.setEnabled(True)
+        self.save_btn.setText('保存选中的图像对')
+        if error:
+            QMessageBox.critical(self, '错误', f'保存失败: {error}')
+            return
+        
+        # 只移除已保存的图像对，保存期间新选择的保留在日志中
+        self.selected_pairs.difference_update(pairs)
+        self.journal.rewrite(self.selected_pairs)
+        self.update_display()
         
         QMessageBox.information(
             self, 
             '成功', 
-            f'已保存 {len(self.selected_pairs)} 对图像！\n'
-            f'编号范围: {start_number} - {start_number + len(self.selected_pairs) - 1}'
+            f'已保存 {len(pairs)} 对图像！\n'
+            f'编号范围: {start_number} - {start_number + len(pairs) - 1}'
         )
-        
-        # 保存完成后清空选择
-        self.selected_pairs.clear()
-        self.update_display()
 
     def previous_folder(self):
         """切换到上一个文件夹"""
@@ -0,0 +1,94 @@
+import os
+import json
+from file_staging import list_staged
+
+# 选择日志文件名，放在image_pairs目录下
+JOURNAL_NAME = 'selection.jsonl'
+
+# 输出编号索引文件名，放在pair2calib目录下
+INDEX_NAME = 'index.json'
+
+class SelectionJournal:
+    """以追加方式记录选择/取消选择操作，程序崩溃后重新打开可以恢复选择
+
+    每行一个json：{"op": "add"或"remove", "rgb": RGB图像路径, "event": 重建图像路径}。
+    保存图像对后调用rewrite()把日志压缩为当前仍选中的图像对。
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        """重放日志，返回仍然选中且文件仍存在的图像对集合"""
+        selected = set()
+        if not os.path.exists(self.path):
+            return selected
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # 崩溃时最后一行可能只写了一半
+                    continue
+                pair = (record['rgb'], record['event'])
+                if record['op'] == 'add':
+                    selected.add(pair)
+                else:
+                    selected.discard(pair)
+        return {pair for pair in selected if all(os.path.exists(p) for p in pair)}
+
+    def _append(self, op, pair):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'op': op, 'rgb': pair[0], 'event': pair[1]}, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def add(self, pair):
+        self._append('add', pair)
+
+    def remove(self, pair):
+        self._append('remove', pair)
+
+    def rewrite(self, selected):
+        """用当前的选择重写日志"""
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for rgb, event in sorted(selected):
+                f.write(json.dumps({'op': 'add', 'rgb': rgb, 'event': event}, ensure_ascii=False) + '\n')
+        os.replace(tmp_path, self.path)
+
+class OutputIndex:
+    """记录pair2calib中已使用的编号及每个编号对应的源图像
+
+    只在索引不存在时扫描一次已有的文件，之后的编号直接从索引中分配。
+    """
+
+    def __init__(self, output_dir, subdirs=('event', 'flir')):
+        self.path = os.path.join(output_dir, INDEX_NAME)
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.next_number = data['next_number']
+            self.pairs = data['pairs']
+        else:
+            # 兼容没有索引时保存的旧输出
+            existing_numbers = [
+                int(name.split('.')[0]) for d in subdirs for name in list_staged(os.path.join(output_dir, d))
+                if name.split('.')[0].isdigit()
+            ]
+            self.next_number = max(existing_numbers, default=0) + 1
+            self.pairs = {}
+
+    def record(self, start_number, pairs):
+        """登记从start_number开始连续编号的图像对并写回索引"""
+        for i, (rgb, event) in enumerate(pairs, start_number):
+            self.pairs[str(i)] = {'flir': rgb, 'event': event}
+        self.next_number = max(self.next_number, start_number + len(pairs))
+        self.save()
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'next_number': self.next_number, 'pairs': self.pairs}, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,82 @@
+import os
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from tqdm import tqdm
+
+# 缩略图的最长边，与select_image_pair的显示区域一致
+THUMBNAIL_SIZE = 500
+
+# 缩略图目录名，放在image_pairs输出目录下
+CACHE_DIR_NAME = '.thumbnails'
+
+def thumbnail_path(path, cache_dir, size=THUMBNAIL_SIZE):
+    """返回图像对应的缩略图路径
+
+    键由绝对路径、修改时间、文件大小和缩略图尺寸组成，原图被替换后自动失效。
+    copy2、硬链接和reflink都保留修改时间，因此整理后的文件与选择器打开的是同一个键。
+    """
+    st = os.stat(path)
+    key = f"{os.path.abspath(path)}|{st.st_mtime_ns}|{st.st_size}|{size}"
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, digest[:2], digest + '.jpg')
+
+def make_thumbnail(path, cache_dir, size=THUMBNAIL_SIZE):
+    """用OpenCV生成缩略图，已存在时跳过
+
+    Returns:
+        缩略图路径
+    """
+    import cv2
+    import numpy as np
+    thumb_path = thumbnail_path(path, cache_dir, size)
+    if os.path.exists(thumb_path):
+        return thumb_path
+    # imdecode/imencode可以处理含中文的路径
+    image = cv2.imdecode(np.fromfile(path, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise IOError(f"无法读取图像: {path}")
+    height, width = image.shape[:2]
+    scale = size / max(height, width)
+    if scale < 1:
+        image = cv2.resize(image, (max(1, round(width * scale)), max(1, round(height * scale))),
+                           interpolation=cv2.INTER_AREA)
+    ok, data = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 95])
+    if not ok:
+        raise IOError(f"无法编码缩略图: {path}")
+    os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+    # 先写临时文件再重命名，多个线程或选择器同时读写时不会读到半个文件
+    tmp_path = thumb_path + f'.{os.getpid()}.tmp'
+    data.tofile(tmp_path)
+    os.replace(tmp_path, thumb_path)
+    return thumb_path
+
+def _make_thumbnail(path, cache_dir, size):
+    try:
+        make_thumbnail(path, cache_dir, size)
+        return None
+    except Exception as e:
+        return str(e)
+
+def build_thumbnails(paths, cache_dir, size=THUMBNAIL_SIZE, workers=8):
+    """并行为一组图像生成缩略图
+
+    Args:
+        paths: 选择器将会打开的图像路径
+        cache_dir: 缩略图目录
+        size: 缩略图最长边
+        workers: 线程数，OpenCV解码和缩放时释放GIL
+
+    Returns:
+        失败列表 [(路径, 错误信息), ...]
+    """
+    failures = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        results = executor.map(_make_thumbnail, paths, [cache_dir] * len(paths), [size] * len(paths))
+        for path, error in tqdm(zip(paths, results), total=len(paths), desc="生成缩略图"):
+            if error is not None:
+                failures.append((path, error))
+    if failures:
+        print(f"{len(failures)}/{len(paths)} 张缩略图生成失败:")
+        for path, error in failures:
+            print(f"  {path}: {error}")
+    return failures
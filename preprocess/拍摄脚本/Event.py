@@ -22,6 +22,7 @@ from metavision_sdk_base import EventCDBuffer
 from metavision_sdk_cv import ActivityNoiseFilterAlgorithm, TrailFilterAlgorithm, SpatioTemporalContrastAlgorithm
 from metavision_sdk_core import PeriodicFrameGenerationAlgorithm, PolarityFilterAlgorithm, RoiFilterAlgorithm
 from metavision_sdk_ui import EventLoop, BaseWindow, MTWindow, UIAction, UIKeyEvent
+from refocus import stack_event_batches, load_fx, refocus_stack, normalize_refocus_image
 
 def ensure_dir(path):
     if not os.path.exists(path):
@@ -60,28 +61,54 @@ def parse_args():
                                   'be opened.')
     return parser.parse_args()
 
+def load_events(input_path, delta_t=1000000, max_duration=1200000000):
+    """读取raw或dat文件中的全部事件，返回字段为x, y, p, t的结构化数组"""
+    mv_iterator = EventsIterator(input_path=str(input_path), delta_t=delta_t, start_ts=0,
+                                 max_duration=max_duration)
+    return stack_event_batches(mv_iterator)
+
+def read_event_batches(ev_data, n_events=1000000):
+    """从已打开的RawReader中逐批读取事件，直到文件结束"""
+    while not ev_data.is_done():
+        yield ev_data.load_n_events(n_events)
+
 def save_time(input_path_dat):
-    record_dat = EventDatReader(input_path_dat)
-    print(record_dat)
-    events = record_dat.load_n_events(record_dat.event_count())  # load the 10 next events
+    events = load_events(input_path_dat)
     print('.................Open Txt.................')
-    with open("test.txt", "w+") as f:
-        for i in range(events.shape[0]):
-            # print(events[i][3]/1000000.0)
-            f.write('{}'.format(events[i][3]/1000000.0) +
-                    ' ' + '{}'.format(events[i][0]-roi_x0-1) +
-                    ' ' + '{}'.format(events[i][1]-roi_y0-1) +
-                    ' ' + '{}\n'.format(events[i][2]))
-        f.close()
+    columns = np.column_stack((events['t'] / 1000000.0,
+                               events['x'].astype(np.int64) - roi_x0 - 1,
+                               events['y'].astype(np.int64) - roi_y0 - 1,
+                               events['p']))
+    np.savetxt("test.txt", columns, fmt=['%.6f', '%d', '%d', '%d'])
     print('.................Close Txt.................')
     print(events)
 
-def e_refocus(raw_path,d=1.3,width=600,height=600,nameout="test",polarity: int = -1,do_time_shifting=True):
+def save_trigger_time(out_dir, trigger_time):
+    """保存触发时间戳：TimeStamps.txt供人工查看，TimeStamps.npy为int64微秒数组供程序读取"""
+    trigger_time = np.asarray(trigger_time, dtype=np.int64)
+    np.save(os.path.join(out_dir, 'TimeStamps.npy'), trigger_time)
+    # 整体格式化后一次写入，避免逐行write
+    lines = ['Timestamp:{}   {}\n'.format(ts, i) for i, ts in enumerate((trigger_time / 1000000).tolist())]
+    with open(os.path.join(out_dir, 'TimeStamps.txt'), "w+") as f:
+        f.write(''.join(lines))
+
+def e_refocus(raw_path,d=1.32,width=600,height=600,nameout="test",polarity: int = -1,do_time_shifting=True,
+              fx=383.547,v=0.1775,camera_params=None):
+    """读取一次事件，对一个或多个目标深度进行合成孔径重聚焦
+
+    事件和触发信号来自同一遍RawReader解码，使用同一时间基准（由do_time_shifting决定）。
+
+    Args:
+        d: 目标深度（米），可以是数值或深度列表
+        fx: 相机焦距（像素），camera_params不为None时从json中读取
+        v: 导轨速度（米/秒）
+        camera_params: stereo_camera_parameters.json路径，读取事件相机(K2)的fx
+    """
     
     triggers = None
     with RawReader(str(raw_path), do_time_shifting=do_time_shifting) as ev_data:
-        while not ev_data.is_done():
-            a = ev_data.load_n_events(1000000)
+        # 解码触发信号时读出的事件直接保留，无需再读一遍文件
+        evs = stack_event_batches(read_event_batches(ev_data))
         triggers = ev_data.get_ext_trigger_events()
     print(f"triggers num = {len(triggers)}")
     try:
@@ -98,12 +125,7 @@ def e_refocus(raw_path,d=1.3,width=600,height=600,nameout="test",polarity: int =
             trigger_time = trigger_time[index]
             
         # wirte time to a txt file
-        with open(os.path.join('dataout', nameout, 'event', 'TimeStamps.txt'), "w+") as f:
-            i = 0
-            for timestamp in trigger_time:
-                # f.write('{}\n'.format(int(timestamp)/1000000000))
-                f.write('Timestamp:{}'.format(timestamp/1000000) + '   ' + '%d\n' % i)
-                i += 1
+        save_trigger_time(os.path.join('dataout', nameout, 'event'), trigger_time)
     except Exception as e:
         print(f"触发信号处理错误: {str(e)}")
         print(f"no trigger signal!")
@@ -115,61 +137,25 @@ def e_refocus(raw_path,d=1.3,width=600,height=600,nameout="test",polarity: int =
         triggers = triggers.copy()
     time_step = len(triggers) 
     frame_t = np.array(triggers)
-    mv_iterator = EventsIterator(input_path=raw_path, delta_t=10000, start_ts=0,
-                                 max_duration=1200000000)
-    x=[]
-    y=[]
-    p=[]
-    t=[]
-  
-    for evs in mv_iterator:
-        e_x, e_y, e_p, e_t = zip(*evs)
-        x.extend(list(e_x))
-        y.extend(list(e_y))
-        p.extend(list(e_p))
-        t.extend(list(e_t))
-    num_events = len(t)
+    num_events = len(evs)
     global roi_x0, roi_y0
-    x=np.array(x)-roi_x0
-    y=np.array(y)-roi_y0
-    p=np.array(p)
-    t=np.array(t)
+    x=evs['x'].astype(np.int64)-roi_x0
+    y=evs['y'].astype(np.int64)-roi_y0
+    p=evs['p']
+    t=evs['t']
 
     print(f"time interval = {(t.max() - t.min())/1e6}s")
 
-    d = 1.32 # 目标深度
-    fx = 383.547  # 相机内参
-    v = 0.1775 # 导轨速度
-    ref_t = t[int(0.5*num_events)]
-    dt = t - ref_t
-    dx = dt * v * fx / d
-    event_x = x + np.round(dx)
-    event_x = np.clip(event_x, 0, width-1)
-    time_step = 30  
-    minT = t.min()
-    maxT = t.max()
-    interval = (maxT - minT) / time_step
-
-    # convert events to event tensors
-    pos = np.zeros((time_step, height, width))
-    neg = np.zeros((time_step, height, width))
-    T,H,W = pos.shape
-    pos = pos.ravel()    #变成一维
-    neg = neg.ravel()    
-    ind = (t / interval).astype(int)
-    ind[ind == T] -= 1
-    event_x = x.astype(int)-x.min().astype(int)
-    event_y = y.astype(int)-y.min().astype(int)
-    pos_ind = p == 1
-    neg_ind = p == 0
-    np.add.at(pos, event_x[pos_ind] + event_y[pos_ind]*W + ind[pos_ind]*W*H, 1)
-    np.add.at(neg, event_x[neg_ind] + event_y[neg_ind]*W + ind[neg_ind]*W*H, 1)
-    pos = np.reshape(pos, (T,H,W))
-    neg = np.reshape(neg, (T,H,W))
-    sum_pos = np.sum(pos+neg,axis=0)
-    sum_pos[sum_pos>3*np.mean(sum_pos)]=np.mean(sum_pos)
-    sum_pos/= np.max(sum_pos)
-    cv2.imwrite(os.path.join(os.path.join('dataout', nameout, 'event'), 'test.png'), sum_pos*255)
+    if camera_params is not None:
+        fx = load_fx(camera_params)
+    depths = np.atleast_1d(d)
+    # 一次遍历事件得到所有深度的重聚焦图像
+    stack = refocus_stack(x, y, t, depths, fx, v, width, height)
+    out_dir = os.path.join('dataout', nameout, 'event')
+    for depth, counts in zip(depths, stack):
+        image = normalize_refocus_image(counts)
+        filename = 'test.png' if len(depths) == 1 else 'refocus_%.3f.png' % depth
+        cv2.imwrite(os.path.join(out_dir, filename), image*255)
     print("OK")
 
 
@@ -277,7 +263,7 @@ class event():
         stop_recording()
 
         print("Finished")
-        trigger = e_refocus(outputpath,d=1.3,nameout=args.nameout)
+        trigger = e_refocus(outputpath,d=1.32,nameout=args.nameout)
         del device
         return 0
 
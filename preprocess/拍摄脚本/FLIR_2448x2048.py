@@ -7,6 +7,7 @@ import cv2
 from threading import Thread
 import numpy as np
 from queue import Queue
+from frame_io import FrameWriterPool, FrameRingBuffer, PreviewThread, new_frame_table, write_frame_table, write_frame_stats
 ############  696 crop
 
 class TriggerType:
@@ -20,6 +21,22 @@ timestamps_m = []
 timestamps_s = []
 MASTERNODE = None
 savestyle = 4
+# 图像保存格式：'png'，'tiff'（不压缩）或'npy'（原始数组），见frame_io.write_frame
+# image_pairs.py只读取PNG，tiff和npy需先用preprocess/debayer.py转换为Master/RGB/{i}.png
+save_format = 'png'
+png_compression = 1  # PNG压缩级别0~9，越小越快
+# 保存图像的线程数；为True时改用进程
+writer_workers = 4
+writer_processes = False
+# 采集与保存之间的帧缓冲区：容量（帧）和满时的策略'block', 'drop-oldest'或'drop-newest'
+ring_capacity = 32
+ring_policy = 'block'
+# 为True时以BayerRG8采集原始Bayer帧（每像素1字节），保存为Master/Bayer/{i}.npy，
+# 采集后用preprocess/debayer.py转换为Master/RGB/{i}.png；写盘带宽约为RGB8Packed的1/3
+raw_bayer = False
+# 实时预览的帧率和最长边，预览在独立线程中显示，不影响采集帧率
+preview_fps = 10.0
+preview_size = 640
 ### 一些参数配置
 ## FLIR从相机
 CHOSEN_TRIGGER = TriggerType.HARDWARE
@@ -54,10 +71,15 @@ class FLIR():
 
     def initSlave(self, num_images, num_sequences, width, height, offx, offy, exposureTime, timeout):
         self.FlirType = FLIRTYPE.SLAVE
-        self.PixelFormat = 'RGB8Packed'
+        self.PixelFormat = 'BayerRG8' if raw_bayer else 'RGB8Packed'
         self.ColorSpace = cv2.COLOR_BAYER_RG2RGB_VNG
         self.Images = Queue()
-        self.TimeStamps = []
+        # savestyle为4时使用固定大小的帧缓冲区，内存不会随写盘变慢而增长
+        self.Frames = FrameRingBuffer(ring_capacity, ring_policy)
+        # 每帧的时间戳、帧号和曝光时间，见frame_io.FRAME_TABLE_COLUMNS
+        self.FrameTable = new_frame_table(num_images)
+        self.FrameCount = 0  # 完整帧的数量，也是下一帧的序号
+        self.IncompleteFrames = 0
         self.NUM_IMAGES = num_images
         self.NUM_SEQ = num_sequences
         self.Width = width
@@ -488,32 +510,23 @@ class FLIR():
             result = False
         return result
 
-    def acquire_timestamp(self):
+    def acquire_timestamp(self, image_result):
+        # 直接读取这一帧自带的chunk数据，写入FrameTable的第FrameCount行
         try:
-            result = True
-            chunk_data_control = PySpin.CCategoryPtr(
-                MASTERNODE.GetNode('ChunkDataControl'))
-            if not PySpin.IsAvailable(chunk_data_control) or not PySpin.IsReadable(chunk_data_control):
-                self.displayErr(format('ChunkDataControl'))
-                return False
-            features = chunk_data_control.GetFeatures()
-            feature = features[16]
-            feature_node = PySpin.CNodePtr(feature)
-            feature_display_name = '\t{}:'.format(
-                feature_node.GetDisplayName())
-            if not PySpin.IsAvailable(feature_node) or not PySpin.IsReadable(feature_node):
-                self.displayErr(format(feature_display_name))
-                result &= False
-            else:
-                feature_value = PySpin.CValuePtr(feature)
-                self.TimeStamps.append(feature_value.ToString())
+            chunk_data = image_result.GetChunkData()
+            self.FrameTable[self.FrameCount] = (self.FrameCount,
+                                                chunk_data.GetTimestamp(),
+                                                chunk_data.GetFrameID(),
+                                                round(chunk_data.GetExposureTime() * 1000))
         except PySpin.SpinnakerException as ex:
             print('Error: %s' % ex)
-            result = False
-        return result
+            return False
+        return True
 
     def acquire_images(self):
         print('*** IMAGE ACQUISITION ***\n')
+        # 在预览窗口按q结束采集
+        preview = PreviewThread("FLIR Camera", preview_fps, preview_size)
         try:
             result = True
             node_acquisition_mode = PySpin.CEnumerationPtr(
@@ -529,20 +542,20 @@ class FLIR():
             node_acquisition_mode.SetIntValue(acquisition_mode_continuous)
             self.displayValue('Acquisition mode','continuous')
             self.cam.BeginAcquisition()
+            preview.start()
             for i in range(self.NUM_IMAGES):
+                if preview.quit_requested.is_set():
+                    break
                 try:
                     image_result = self.cam.GetNextImage(self.TimeOut)
                     if image_result.IsIncomplete():
+                        self.IncompleteFrames += 1
                         print('Image incomplete with image status %d...' %
                             image_result.GetImageStatus())
                     else:
                         image_data = image_result.GetNDArray()
-                        cv2.namedWindow("FLIR Camera", cv2.WINDOW_NORMAL)
-                        cv2.resizeWindow("FLIR Camera", 640, 480) 
-                        cv2.imshow("FLIR Camera", image_data)
-                        if cv2.waitKey(1) & 0xFF == ord('q'):
-                            break
-                        self.acquire_timestamp()
+                        preview.offer(image_data)
+                        self.acquire_timestamp(image_result)
                         if savestyle == 1:
                             self.Images.put(image_result)
                         elif savestyle == 2:
@@ -554,37 +567,56 @@ class FLIR():
                             filename =  self.SaveImgFile + '/img/image-%d.jpg' % i
                             image_result.Save(filename)
                         elif savestyle == 4:
-                            self.Images.put(image_result.GetNDArray())
+                            # 拷贝进缓冲区的槽位后即可释放相机缓冲；被丢弃的帧仍占用序号，与TimeStamps.txt对齐
+                            self.Frames.put(image_data, self.FrameCount)
                         elif savestyle == 5:
                             self.Images.put(image_result.GetData())
                         elif savestyle == 6:
                             self.Images.put(image_result)
+                        self.FrameCount += 1
                         image_result.Release()
                 except PySpin.SpinnakerException as ex:
                     print('Error: %s' % ex)
                     result = False
                     break
             self.cam.EndAcquisition()
-            cv2.destroyAllWindows()
         except PySpin.SpinnakerException as ex:
             print('Error: %s' % ex)
             result = False
+        finally:
+            preview.stop()
+            # 通知保存线程采集已结束，提前返回时也不能让保存线程一直等待
+            self.Frames.close()
         return result
     
     def save_images_thread(self):
-        ensure_dir(os.path.join('dataout', name_out, 'Master', 'RGB'))
-        i = 0
-        while i < self.NUM_IMAGES:
-            res_RGB = self.Images.get()
-            filename_RGB = os.path.join('dataout', name_out, 'Master', 'RGB', '%d.png' % i)
-            cv2.imwrite(filename_RGB, res_RGB)
-            print(f'Saving RGB image {i}: {res_RGB.shape}')
-            i += 1
+        # 由写入池并行编码，第i帧保存为RGB/i.png（或.tiff/.npy），与TimeStamps.txt的第i行对应
+        if raw_bayer:
+            # 原始帧不压缩直接保存，去马赛克留到采集之后
+            out_dir, fmt = os.path.join('dataout', name_out, 'Master', 'Bayer'), 'npy'
+        else:
+            out_dir, fmt = os.path.join('dataout', name_out, 'Master', 'RGB'), save_format
+        with FrameWriterPool(out_dir, fmt, png_compression, writer_workers, writer_processes) as writer:
+            while True:
+                item = self.Frames.get()
+                if item is None:
+                    break
+                slot, index = item
+                # 写完后归还槽位供后续帧使用
+                writer.submit(index, self.Frames.frame(slot), on_done=lambda _, slot=slot: self.Frames.release(slot))
+        print(f'已保存 {writer.written} 张图像到 {out_dir}')
+        
+        # 丢帧和不完整帧的统计，与TimeStamps.txt放在一起
+        write_frame_stats(os.path.join('dataout', name_out, 'Master', 'FrameStats.txt'), {
+            'frames': self.FrameCount,
+            'incomplete': self.IncompleteFrames,
+            'dropped': self.Frames.dropped,
+            'saved': writer.written,
+            'policy': self.Frames.policy,
+            'capacity': self.Frames.capacity,
+        })
         
-        with open(os.path.join('dataout', name_out, 'Master', 'TimeStamps.txt'), "w+") as f:
-            for i in range(len(self.TimeStamps)):
-                timestamp = self.TimeStamps[i]
-                f.write('Timestamp:{}'.format(int(timestamp)/1000000000) + ' ' + '%d.jpg\n' % i)
+        write_frame_table(os.path.join('dataout', name_out, 'Master'), self.FrameTable[:self.FrameCount])
         print('All images are saved!')
 
 class Flir():
@@ -647,6 +679,8 @@ class Flir():
         save_thread.start()
 
         slave.acquire_images()
+        # 等待缓冲区中剩余的帧保存完毕
+        save_thread.join()
         print("拍完了，快断开事件相机")
         slave.reset_sequencer()
         if not slave.disable_chunk_data():
@@ -0,0 +1,259 @@
+import os
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import cv2
+import numpy as np
+
+# 保存格式对应的扩展名
+FRAME_FORMATS = {'png': '.png', 'tiff': '.tiff', 'npy': '.npy'}
+
+def write_frame(path, frame, fmt='png', png_level=1):
+    """按格式保存一帧图像
+
+    Args:
+        path: 输出路径（含扩展名）
+        frame: 图像数组
+        fmt: 'png'，'tiff'（不压缩）或'npy'（原始数组，最快）
+        png_level: PNG压缩级别0~9，越小越快、文件越大
+    """
+    if fmt == 'npy':
+        np.save(path, frame)
+        return
+    if fmt == 'png':
+        params = [cv2.IMWRITE_PNG_COMPRESSION, png_level]
+    elif fmt == 'tiff':
+        params = [cv2.IMWRITE_TIFF_COMPRESSION, 1]  # 1为不压缩
+    else:
+        raise ValueError(f"未知的保存格式: {fmt}")
+    if not cv2.imwrite(path, frame, params):
+        raise IOError(f"保存失败: {path}")
+
+class FrameWriterPool:
+    """多线程（或多进程）保存图像，文件名由帧序号决定，与写入完成的先后无关
+
+    cv2.imwrite在编码时释放GIL，因此线程池即可并行编码；
+    使用进程池时每帧需要拷贝到子进程，只在编码非常慢时使用。
+    在途的帧数超过max_pending时submit会阻塞，避免写盘跟不上时内存无限增长。
+    """
+
+    def __init__(self, out_dir, fmt='png', png_level=1, workers=4, use_processes=False, max_pending=None):
+        if fmt not in FRAME_FORMATS:
+            raise ValueError(f"未知的保存格式: {fmt}")
+        os.makedirs(out_dir, exist_ok=True)
+        self.out_dir = out_dir
+        self.fmt = fmt
+        self.png_level = png_level
+        executor_type = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+        self.executor = executor_type(max_workers=workers)
+        self.slots = threading.BoundedSemaphore(max_pending or 2 * workers)
+        self.lock = threading.Lock()
+        self.written = 0
+        self.errors = []
+
+    def frame_path(self, index):
+        return os.path.join(self.out_dir, '%d%s' % (index, FRAME_FORMATS[self.fmt]))
+
+    def submit(self, index, frame, on_done=None):
+        """提交第index帧
+
+        Args:
+            index: 帧序号，决定文件名
+            frame: 图像数组，写完之前调用方不能修改它
+            on_done: 写完（或失败）后调用 on_done(index)，可用于归还缓冲区
+        """
+        self.slots.acquire()
+        future = self.executor.submit(write_frame, self.frame_path(index), frame, self.fmt, self.png_level)
+        future.add_done_callback(lambda f: self._done(index, f, on_done))
+
+    def _done(self, index, future, on_done):
+        error = future.exception()
+        with self.lock:
+            if error is None:
+                self.written += 1
+            else:
+                self.errors.append((index, error))
+        self.slots.release()
+        if on_done is not None:
+            on_done(index)
+
+    def close(self):
+        """等待所有帧写完"""
+        self.executor.shutdown(wait=True)
+        for index, error in self.errors:
+            print(f'第{index}帧保存失败: {error}')
+        return self.written
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+# 环形缓冲区满时的处理方式
+#   block: 阻塞采集线程直到有空闲槽位
+#   drop-oldest: 丢弃最早一帧尚未开始保存的图像
+#   drop-newest: 丢弃新到的这一帧
+RING_POLICIES = ('block', 'drop-oldest', 'drop-newest')
+
+class FrameRingBuffer:
+    """固定大小、预分配的帧缓冲区，槽位在帧之间重复使用
+
+    采集线程put()把帧拷贝进空闲槽位，保存线程get()取出槽位，
+    写完后release()归还。内存占用固定为capacity帧，不会随写盘变慢而增长。
+    """
+
+    def __init__(self, capacity=32, policy='block'):
+        if policy not in RING_POLICIES:
+            raise ValueError(f"未知的缓冲策略: {policy}")
+        self.capacity = capacity
+        self.policy = policy
+        self.frames = None  # 第一帧到达时按其形状分配
+        self.free = list(range(capacity))
+        self.ready = deque()  # (槽位, 帧序号)
+        self.condition = threading.Condition()
+        self.closed = False
+        self.stored = 0
+        self.dropped = 0
+
+    def put(self, frame, index):
+        """把一帧拷贝进缓冲区
+
+        Returns:
+            是否保存了这一帧（按策略被丢弃时为False）
+        """
+        with self.condition:
+            if self.frames is None:
+                self.frames = np.empty((self.capacity,) + frame.shape, dtype=frame.dtype)
+            if not self.free:
+                if self.policy == 'drop-oldest' and self.ready:
+                    slot, _ = self.ready.popleft()
+                    self.free.append(slot)
+                    self.dropped += 1
+                elif self.policy == 'block':
+                    while not self.free:
+                        self.condition.wait()
+                else:
+                    # drop-newest，或drop-oldest时所有槽位都正在保存
+                    self.dropped += 1
+                    return False
+            slot = self.free.pop()
+        # 拷贝时不持有锁，保存线程可以同时取帧
+        self.frames[slot] = frame
+        with self.condition:
+            self.ready.append((slot, index))
+            self.stored += 1
+            self.condition.notify_all()
+        return True
+
+    def get(self):
+        """取出最早的一帧，返回(槽位, 帧序号)；缓冲区关闭且已取空时返回None"""
+        with self.condition:
+            while not self.ready and not self.closed:
+                self.condition.wait()
+            if not self.ready:
+                return None
+            return self.ready.popleft()
+
+    def frame(self, slot):
+        return self.frames[slot]
+
+    def release(self, slot):
+        """归还保存完毕的槽位"""
+        with self.condition:
+            self.free.append(slot)
+            self.condition.notify_all()
+
+    def close(self):
+        """采集结束，get()在取完剩余的帧后返回None"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+# 每帧的chunk数据：帧序号（与RGB/{index}.png对应）、相机时间戳（纳秒）、相机帧号、曝光时间（纳秒）
+FRAME_TABLE_COLUMNS = ('index', 'timestamp_ns', 'frame_id', 'exposure_ns')
+
+def new_frame_table(num_frames):
+    """预分配帧信息表，每行对应一帧，列见FRAME_TABLE_COLUMNS"""
+    return np.zeros((num_frames, len(FRAME_TABLE_COLUMNS)), dtype=np.int64)
+
+def write_frame_table(out_dir, table):
+    """采集结束后一次性保存帧信息表和兼容旧格式的时间戳
+
+    FrameTable.npy为int64数组供程序读取，FrameTable.csv供人工查看；
+    TimeStamps.txt保持'Timestamp:{秒} {i}.jpg'的格式，match_timestamps按该格式解析。
+
+    Args:
+        out_dir: Master目录
+        table: new_frame_table返回的数组中已填写的行
+    """
+    table = np.asarray(table, dtype=np.int64)
+    np.save(os.path.join(out_dir, 'FrameTable.npy'), table)
+    np.savetxt(os.path.join(out_dir, 'FrameTable.csv'), table, fmt='%d', delimiter=',',
+               header=','.join(FRAME_TABLE_COLUMNS), comments='')
+    # 整体格式化后一次写入，避免逐行write
+    lines = ['Timestamp:{} {}.jpg\n'.format(ts / 1000000000, index)
+             for index, ts in zip(table[:, 0].tolist(), table[:, 1].tolist())]
+    with open(os.path.join(out_dir, 'TimeStamps.txt'), "w+") as f:
+        f.write(''.join(lines))
+
+def write_frame_stats(path, stats):
+    """把采集统计（帧数、丢帧数等）写成每行'名称: 值'的文本"""
+    with open(path, 'w') as f:
+        f.write(''.join(f'{name}: {value}\n' for name, value in stats.items()))
+
+class PreviewThread(threading.Thread):
+    """在独立线程中以固定帧率显示降采样的实时预览
+
+    采集线程每帧调用offer()，只有到了预览时刻才做一次隔行隔列的抽样拷贝，
+    窗口的创建、缩放、imshow和waitKey都在预览线程中完成，不占用采集循环。
+    在预览窗口按q后quit_requested被置位，由采集线程决定何时停止。
+    """
+
+    def __init__(self, window_name='FLIR Camera', fps=10.0, max_size=640):
+        super().__init__(daemon=True)
+        self.window_name = window_name
+        self.interval = 1.0 / fps
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.latest = None
+        self.last_offer = 0.0
+        self.quit_requested = threading.Event()
+        self.stopped = threading.Event()
+
+    def offer(self, frame):
+        """提交一帧，距上次预览不足1/fps秒时直接返回"""
+        now = time.monotonic()
+        if now - self.last_offer < self.interval:
+            return
+        self.last_offer = now
+        step = -(-max(frame.shape[:2]) // self.max_size)
+        # 抽样后拷贝，调用方随后可以释放相机缓冲
+        if frame.ndim == 2:
+            # 原始Bayer帧：用偶数步长只取同一位置的绿色像素作为灰度预览
+            step += step % 2
+            small = frame[::step, 1::step].copy()
+        else:
+            small = frame[::step, ::step].copy()
+        with self.lock:
+            self.latest = small
+
+    def run(self):
+        cv2.namedWindow(self.window_name, cv2.WINDOW_NORMAL)
+        wait_ms = max(1, int(self.interval * 1000))
+        while not self.stopped.is_set():
+            with self.lock:
+                frame, self.latest = self.latest, None
+            if frame is not None:
+                cv2.imshow(self.window_name, frame)
+            if cv2.waitKey(wait_ms) & 0xFF == ord('q'):
+                self.quit_requested.set()
+        cv2.destroyWindow(self.window_name)
+
+    def stop(self):
+        """关闭预览窗口并等待线程退出"""
+        self.stopped.set()
+        if self.is_alive():
+            self.join()
@@ -0,0 +1,142 @@
+import json
+import numpy as np
+
+def stack_event_batches(batches, initial_capacity=1 << 22):
+    """将EventsIterator等逐批产生的事件结构化数组拼接为一个数组
+
+    直接按结构化数组整体拷贝到预分配的缓冲区中，容量不足时翻倍，
+    不会把事件拆成逐个的Python对象。
+
+    Args:
+        batches: 可迭代的事件结构化数组（字段x, y, p, t）
+        initial_capacity: 初始缓冲区容量（事件数）
+
+    Returns:
+        拼接后的事件结构化数组
+    """
+    buffer = None
+    count = 0
+    for evs in batches:
+        n = len(evs)
+        if n == 0:
+            continue
+        if buffer is None:
+            buffer = np.empty(max(initial_capacity, n), dtype=evs.dtype)
+        elif count + n > len(buffer):
+            grown = np.empty(max(2 * len(buffer), count + n), dtype=buffer.dtype)
+            grown[:count] = buffer[:count]
+            buffer = grown
+        # 迭代器可能复用每批的内存，因此在这里拷贝
+        buffer[count:count + n] = evs
+        count += n
+    if buffer is None:
+        return np.empty(0, dtype=[('x', '<u2'), ('y', '<u2'), ('p', '<i2'), ('t', '<i8')])
+    return buffer[:count]
+
+def accumulate_events(x, y, width, height, t=None, time_bins=None, p=None, polarity=None,
+                      dtype=np.uint32):
+    """用np.bincount将事件累积为计数图像
+
+    先把(t, y, x)线性化为一维索引，再一次bincount得到计数，
+    比np.add.at快得多，且输出使用紧凑的整数类型。
+
+    Args:
+        x, y: 事件坐标，超出[0, width) x [0, height)的事件被丢弃
+        width, height: 输出图像尺寸
+        t: 事件时间戳，time_bins不为None时需要
+        time_bins: 时间维度的分箱数，为None时跳过时间维度直接得到积分图像
+        p: 事件极性
+        polarity: 只统计极性等于polarity的事件，为None时统计全部事件
+        dtype: 输出计数的数据类型
+
+    Returns:
+        (height, width)或(time_bins, height, width)的计数数组
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    mask = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+    if polarity is not None:
+        mask &= np.asarray(p) == polarity
+    if not mask.all():
+        x = x[mask]
+        y = y[mask]
+        if t is not None:
+            t = np.asarray(t)[mask]
+    index = y.astype(np.intp) * width + x
+
+    size = height * width
+    shape = (height, width)
+    if time_bins is not None:
+        t = np.asarray(t, dtype=np.int64)
+        if len(t) > 0:
+            t0 = t.min()
+            span = t.max() - t0 + 1
+            # 整数运算分箱，最后一个事件落在time_bins-1中
+            index += ((t - t0) * time_bins // span).astype(np.intp) * size
+        size *= time_bins
+        shape = (time_bins, height, width)
+
+    counts = np.bincount(index, minlength=size)
+    return counts.astype(dtype, copy=False).reshape(shape)
+
+def load_fx(camera_params_path, key='K2'):
+    """从stereo_camera_parameters.json中读取相机焦距fx（像素）
+
+    Args:
+        camera_params_path: calib_联合/save_parameters.m导出的json文件
+        key: 内参矩阵的键名，K1为FLIR相机，K2为事件相机
+    """
+    with open(camera_params_path, 'r') as f:
+        params = json.load(f)
+    return float(params[key][0][0])
+
+def refocus_stack(x, y, t, depths, fx, v, width, height, ref_t=None, chunk_size=1 << 20,
+                  dtype=np.uint32):
+    """合成孔径重聚焦：一次遍历事件，得到多个深度下的重聚焦图像
+
+    相机以速度v沿x方向匀速运动时，深度d处的点在时刻t的像素位移为
+    dx = (t - ref_t) * v * fx / d，把每个事件按dx平移回参考时刻后由accumulate_events累积。
+    事件按chunk_size分块，每块只计算一次时间差，再依次平移到各个深度，以限制内存。
+
+    Args:
+        x, y: 事件坐标（已减去ROI偏移）
+        t: 事件时间戳（微秒）
+        depths: 目标深度列表（米）
+        fx: 相机焦距（像素）
+        v: 导轨速度（米/秒）
+        width, height: 输出图像尺寸
+        ref_t: 参考时刻（微秒），默认取中间事件的时间
+        chunk_size: 每块处理的事件数
+        dtype: 输出计数的数据类型
+
+    Returns:
+        (len(depths), height, width)的计数数组，顺序与depths一致
+    """
+    depths = np.atleast_1d(np.asarray(depths, dtype=np.float64))
+    num_depths = len(depths)
+    t = np.asarray(t)
+    if ref_t is None:
+        ref_t = t[len(t) // 2] if len(t) > 0 else 0
+    # 每个深度的像素/秒位移系数
+    gains = v * fx / depths
+
+    counts = np.zeros((num_depths, height, width), dtype=np.int64)
+    for start in range(0, len(t), chunk_size):
+        end = start + chunk_size
+        cx = np.asarray(x[start:end], dtype=np.float64)
+        cy = np.asarray(y[start:end], dtype=np.intp)
+        dt = (t[start:end] - ref_t) * 1e-6
+        for k, gain in enumerate(gains):
+            shifted_x = np.rint(cx + dt * gain).astype(np.intp)
+            counts[k] += accumulate_events(shifted_x, cy, width, height, dtype=np.int64)
+    return counts.astype(dtype, copy=False)
+
+def normalize_refocus_image(counts):
+    """抑制热点像素（大于3倍均值的置为均值）并归一化到[0, 1]"""
+    image = counts.astype(np.float32)
+    mean = np.mean(image)
+    image[image > 3 * mean] = mean
+    peak = np.max(image)
+    if peak > 0:
+        image /= peak
+    return image